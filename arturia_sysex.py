@@ -0,0 +1,223 @@
+# Single-pass parser for the Arturia "set text" sysex
+#
+# Sysex message format used by AnalogLab to write to the display:
+# F0               # sysex header
+# 00 20 6B 7F 42   # Arturia header
+# 04 ?? 60         # set text (?? is 00 for KeyLab Essential, 02 for Minilab3)
+# 01 S1 00         # S1 = Instrument (e.g. 'ARP 2600')
+# 02 S2 00         # S2 = Name (e.g. 'Bloody Swing')
+# 03 S3 00         # S3 = Type (e.g. 'Noise')
+# 04 S4 00         # S4 = Whether to display a heart (46 20) - OPTIONAL
+# F7               # sysex footer
+#
+# The Minilab3 layout has a 7 byte preamble between "60" and the first field:
+# F0 00 20 6B 7F 42 04 02 60 1F 07 01 00 00 01 00 01 Line1 00 02 Line2 00 F7
+#
+# The parser walks the message once and only records where each field starts and ends,
+# so no lists, slices or strings are created while parsing.
+
+ARTURIA_HEADER = b"\xF0\x00\x20\x6B\x7F\x42"
+
+SET_TEXT = 0x04
+SET_TEXT_KEYLAB = 0x00
+SET_TEXT_MINILAB3 = 0x02
+
+# Offset of the first field tag for each layout
+KEYLAB_FIELDS_OFFSET = 9
+MINILAB3_FIELDS_OFFSET = 16
+
+FIELD_COUNT = 4
+
+# Sent after the identity reply; sets the DAW mode into Mackie???
+SET_DAW_MODE_MACKIE = b"\xF0\x00\x20\x6B\x7F\x42\x02\x00\x40\x51\x00\xF7"
+
+# Parser states
+_TAG = 0
+_TEXT = 1
+
+
+def new_fields():
+    # Start and end offset of S1...S4; -1 means the field is not present
+    return [-1] * (2 * FIELD_COUNT)
+
+
+def is_set_text(msg, length):
+    if length < KEYLAB_FIELDS_OFFSET + 1:
+        return False
+    for i in range(6):
+        if msg[i] != ARTURIA_HEADER[i]:
+            return False
+    return msg[6] == SET_TEXT and msg[8] == 0x60
+
+
+def parse_set_text(msg, fields, length=None):
+    # Fill fields with the offsets of S1...S4 in msg and return the number of fields found.
+    # Returns -1 if msg is not a set text sysex.
+    if length is None:
+        length = len(msg)
+    if not is_set_text(msg, length):
+        return -1
+    for i in range(2 * FIELD_COUNT):
+        fields[i] = -1
+    if msg[7] == SET_TEXT_MINILAB3:
+        i = MINILAB3_FIELDS_OFFSET
+    else:
+        i = KEYLAB_FIELDS_OFFSET
+    found = 0
+    state = _TAG
+    slot = 0
+    while i < length:
+        b = msg[i]
+        if b == 0xF7:
+            break
+        if state == _TAG:
+            if 0x01 <= b <= FIELD_COUNT:
+                slot = 2 * (b - 1)
+                fields[slot] = i + 1
+                state = _TEXT
+        elif b == 0x00:
+            fields[slot + 1] = i
+            found += 1
+            state = _TAG
+        i += 1
+    if state == _TEXT:
+        # Field was not terminated by 00, end it at F7 or at the end of the message
+        fields[slot + 1] = i
+        found += 1
+    return found
+
+
+def field_length(fields, n):
+    start = fields[2 * n]
+    if start < 0:
+        return -1
+    return fields[2 * n + 1] - start
+
+
+def field_equals(msg, fields, n, expected):
+    # Compare field n (0 = S1) with expected without slicing msg
+    start = fields[2 * n]
+    if start < 0 or fields[2 * n + 1] - start != len(expected):
+        return False
+    for i in range(len(expected)):
+        if msg[start + i] != expected[i]:
+            return False
+    return True
+
+
+def has_heart(msg, fields):
+    return field_equals(msg, fields, 3, b"\x46\x20")
+
+
+def field_string(msg, fields, n):
+    # Field n as a str, e.g. for logging; this allocates, unlike everything else here
+    start = fields[2 * n]
+    if start < 0:
+        return None
+    return bytes(msg[start:fields[2 * n + 1]]).decode()
+
+
+if __name__ == "__main__":
+    # Benchmark against the list based code path that code.py used before
+    # On CPython, the single pass is slower than the list based code (about 110k against 150k...220k
+    # messages/s here), since it loops over the bytes in Python where that uses list.index() and slicing,
+    # and it translates S1 and S2 for the LCD as well; what it wins is allocation, about 96 bytes against
+    # 1107 bytes per message, which is what matters for garbage collection pauses on the device
+    import gc
+    import time
+
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    def legacy_parse(message_bytes):
+        bytes = list(message_bytes)
+        if bytes[9] != 0x01:
+            bytes = bytes[:9] + bytes[15:]
+        try:
+            first_0x01 = bytes.index(0x01)
+            first_0x00_after_0x01 = bytes.index(0x00, first_0x01)
+        except:
+            first_0x01 = None
+            first_0x00_after_0x01 = None
+        try:
+            first_0x02_after_0x00 = bytes.index(0x02, first_0x00_after_0x01)
+            first_0x00_after_0x02 = bytes.index(0x00, first_0x02_after_0x00)
+        except:
+            first_0x02_after_0x00 = None
+            first_0x00_after_0x02 = None
+        try:
+            first_0x03_after_0x00 = bytes.index(0x03, first_0x00_after_0x02)
+            first_0x00_after_0x03 = bytes.index(0x00, first_0x03_after_0x00)
+        except:
+            first_0x03_after_0x00 = None
+            first_0x00_after_0x03 = None
+        try:
+            first_0x04_after_0x00 = bytes.index(0x04, first_0x00_after_0x03)
+            first_0x00_after_0x04 = bytes.index(0x00, first_0x04_after_0x00)
+        except:
+            first_0x04_after_0x00 = None
+            first_0x00_after_0x04 = None
+        S1 = bytes[first_0x01 + 1:first_0x00_after_0x01]
+        S2 = bytes[first_0x02_after_0x00 + 1:first_0x00_after_0x02] if first_0x02_after_0x00 is not None else None
+        S3 = bytes[first_0x03_after_0x00 + 1:first_0x00_after_0x03] if first_0x03_after_0x00 is not None else None
+        S4 = bytes[first_0x04_after_0x00 + 1:first_0x00_after_0x04] if first_0x04_after_0x00 is not None else None
+        S1_string = ''.join([chr(b) for b in S1])
+        S2_string = ''.join([chr(b) for b in S2]) if S2 is not None else None
+        S3_string = ''.join([chr(b) for b in S3]) if S3 is not None else None
+        S4_string = ''.join([chr(b) for b in S4]) if S4 is not None else None
+        return S4 == [0x46, 0x20]
+
+    from charset import FieldText, LCD_TEXT
+
+    fields = new_fields()
+    text = FieldText()
+
+    def single_pass_parse(msg):
+        # msg is indexed directly, as the controller does with the framer's buffer
+        parse_set_text(msg, fields)
+        # S1 and S2 translated for the LCD, as the controller draws them
+        text.translate(msg, fields[0], fields[1], LCD_TEXT)
+        if fields[2] >= 0:
+            text.translate(msg, fields[2], fields[3], LCD_TEXT)
+        return has_heart(msg, fields)
+
+    messages = [
+        bytes.fromhex("F0 00 20 6B 7F 42 04 00 60 01 41 52 50 20 32 36 30 30 00 02 2A 42 6C 6F 6F 64 79 20 53 77 69 6E 67 00 03 4E 6F 69 73 65 00 04 46 20 00 F7"),
+        bytes.fromhex("F0 00 20 6B 7F 42 04 00 60 01 41 52 50 20 32 36 30 30 00 02 2A 42 6C 6F 6F 64 79 20 53 77 69 6E 67 00 03 4E 6F 69 73 65 00 04 00 F7"),
+        bytes.fromhex("F0 00 20 6B 7F 42 04 02 60 1F 07 01 00 00 01 00 01 4A 75 70 69 74 65 72 2D 38 00 02 42 72 61 73 73 20 20 20 4C 65 61 64 00 F7"),
+    ]
+
+    def allocated(parse):
+        # Bytes allocated per message
+        if tracemalloc is not None:
+            total = 0
+            tracemalloc.start()
+            for message in messages:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                parse(message)
+                total += tracemalloc.get_traced_memory()[1] - before
+            tracemalloc.stop()
+            return total / len(messages)
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        for message in messages:
+            parse(message)
+        after = gc.mem_alloc()
+        gc.enable()
+        return (after - before) / len(messages)
+
+    def rate(parse, iterations=2000):
+        start = time.monotonic_ns()
+        for _ in range(iterations):
+            for message in messages:
+                parse(message)
+        elapsed = time.monotonic_ns() - start
+        return iterations * len(messages) * 1000000000 / elapsed
+
+    for name, parse in (("legacy", legacy_parse), ("single pass", single_pass_parse)):
+        assert parse(messages[0]) and not parse(messages[1])
+        print("{}: {:.0f} messages/s, {:.0f} bytes allocated/message".format(name, rate(parse), allocated(parse)))
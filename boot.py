@@ -10,22 +10,20 @@ import usb_hid
 import storage
 import digitalio
 import board
+import microcontroller
 
-# According to https://www.youtube.com/watch?v=ipnTPsDN3t4, the MIDI port is called "Keylab mkII 61 MIDI"
-# USB vendor ID, USB product ID, USB manufacturer string, USB product string, MIDI interface name (that shows up in AnalogLab)
-emulated_protocols = [(0x1c75, 0x028a, "Arturia", "Arturia KeyLab Essential 61", "Arturia KeyLab Essential 61"), # Works
-                      (0x1c75, 0x028b, "Arturia", "KeyLab mkII 61", "KeyLab mkII 61 MIDI"), # Works
-                      (0x1c75, 0x0285, "Arturia", "KeyLab 61", "KeyLab 61"), # Works but seems to have DIFFERENT MIDI CC mappings than the KeyLab mkII 61
-                      (0x1c75, 0x220b, "Arturia", "Minilab3", "Minilab3 MIDI"), # NOTE: lower-case "l" in "Minilab"! "Minilab3 MIDI" is confirmed from https://youtu.be/Zcwdv4ZYipw?feature=shared&t=529 and the USB descriptor name form https://linux-hardware.org/?device_vendor=Arturia&device_type=sound
-                      ] 
+from profiles import PROFILES
+from settings import Settings
 
-# NOTE: "Arturia KeyLab Essential 61 MID" does NOT work with AnalogLab standalone!
-
-# NOTE: Minilab 3 has 3(!) MIDI cables: "Minilab3 MIDI", "Minilab3 DIN THRU", "Minilab3 MCU"
-# as can be seen in https://youtu.be/Zcwdv4ZYipw?feature=shared&t=529
-
-which_protocol = 3
-product=emulated_protocols[which_protocol][3] # We use this in code.py
+# Which device gets emulated; see profiles.py for the available profiles and what they are known to work with
+which_profile = "minilab3"
+# ...unless another one was chosen with "profile <name>" on the serial console, which is kept in nvm
+settings = Settings(microcontroller.nvm) # We use this in code.py
+# (one that cannot be emulated, e.g. saved by an older firmware, is ignored rather than keeping the device from starting)
+if settings.profile in PROFILES and PROFILES[settings.profile].pid is not None:
+    which_profile = settings.profile
+profile = PROFILES[which_profile] # We use this in code.py
+product = profile.product
 
 if __name__ == "__main__":
 
@@ -36,21 +34,31 @@ if __name__ == "__main__":
     if buttons[2].value == True:
         # Prevent USB mass storage from being mounted on RPi Pico
         storage.disable_usb_drive()
+        # The host cannot write to CIRCUITPY now, so the firmware can, e.g. to save MIDI traces (see midi_trace.py)
+        storage.remount("/", readonly=False)
     # If button 3 is pressed, then go into bootloader mode, allowing for CircuitPython to be reinstalled
     # or other firmware to be uploaded without access to the BOOTSEL button on the RPi Pico
     if buttons[3].value == False:
-        import microcontroller
         microcontroller.on_next_reset(microcontroller.RunMode.BOOTLOADER)
         microcontroller.reset()
 
+    if profile.pid is None:
+        raise ValueError("The USB product ID of " + which_profile + " is unknown, it cannot be emulated yet")
+
     usb_hid.disable()
-    supervisor.set_usb_identification(manufacturer=emulated_protocols[which_protocol][2], product=emulated_protocols[which_protocol][3], vid=emulated_protocols[which_protocol][0], pid=emulated_protocols[which_protocol][1])
-    usb_midi.set_names(streaming_interface_name=emulated_protocols[which_protocol][4], audio_control_interface_name=emulated_protocols[which_protocol][4])
+    supervisor.set_usb_identification(manufacturer=profile.manufacturer, product=profile.product, vid=profile.vid, pid=profile.pid)
+    # CircuitPython's usb_midi has a single USB MIDI cable (one input and one output jack), and no way to
+    # register more, so only the first cable of the profile can be; what the real device gets on its other
+    # cables (e.g. MCU on the Minilab3) has to be sent to this one, and the mode decides what it is
+    cable_name = profile.cables[0]
+    usb_midi.set_names(streaming_interface_name=profile.port_name, audio_control_interface_name=profile.port_name,
+                       in_jack_name=cable_name, out_jack_name=cable_name)
     usb_midi.enable()
     print("enabled USB MIDI, disabled USB HID")
-    print("manufacturer: ", emulated_protocols[which_protocol][2])
-    print("product: ", emulated_protocols[which_protocol][3])
-    print("vid: ", emulated_protocols[which_protocol][0])
-    print("pid: ", emulated_protocols[which_protocol][1])
-    print("streaming_interface_name: ", emulated_protocols[which_protocol][4])
-    print("audio_control_interface_name: ", emulated_protocols[which_protocol][4])
+    print("manufacturer: ", profile.manufacturer)
+    print("product: ", profile.product)
+    print("vid: ", profile.vid)
+    print("pid: ", profile.pid)
+    print("streaming_interface_name: ", profile.port_name)
+    print("audio_control_interface_name: ", profile.port_name)
+    print("cables: ", cable_name, "of", ", ".join(profile.cables))
@@ -0,0 +1,130 @@
+# Translation of the text that hosts send into what the HD44780 LCD can show
+#
+# The A00 character ROM follows ASCII for most of 20...7D, but has a yen sign at 5C and arrows at 7E and 7F,
+# custom characters at 00...0F, and Japanese and Greek characters above 7F. LCD_TEXT maps every byte to the
+# character code that shows it best: ROM characters where there is a match, glyphs from glyphs.py for
+# backslash, tilde and some accented letters, the plain letter for other accented letters, and a space for
+# everything that cannot be shown. Latin-1 text (from hosts that do not stick to 7 bit ASCII) is covered too.
+# LCD_TEXT_HEART is the same, but shows "*" as the heart, for the preset names of favorites.
+#
+# FieldText translates a text field of a sysex message in a single pass into a reusable buffer, without
+# creating any objects per character, and leaves out spaces the way the Minilab3 does at the same time.
+
+from glyphs import (HEART, BACKSLASH, TILDE, E_ACUTE, E_GRAVE, E_CIRCUMFLEX, A_ACUTE, A_GRAVE, A_RING, C_CEDILLA,
+                    I_ACUTE, O_ACUTE, O_SLASH, U_ACUTE)
+
+# Latin-1 C0...FF without their accents
+_LATIN1_BASE = b"AAAAAAACEEEEIIIIDNOOOOOxOUUUUYPsaaaaaaaceeeeiiiidnooooo/ouuuuypy"
+
+# Latin-1 characters that the ROM has, or that have a glyph
+_LATIN1_SPECIAL = (
+    (0xA2, 0xEC),  # cent
+    (0xA5, 0x5C),  # yen
+    (0xB0, 0xDF),  # degree
+    (0xB5, 0xE4),  # micro
+    (0xB7, 0xA5),  # middle dot
+    (0xDF, 0xE2),  # sharp s
+    (0xE0, A_GRAVE),
+    (0xE1, A_ACUTE),
+    (0xE4, 0xE1),  # a umlaut
+    (0xE5, A_RING),
+    (0xE7, C_CEDILLA),
+    (0xE8, E_GRAVE),
+    (0xE9, E_ACUTE),
+    (0xEA, E_CIRCUMFLEX),
+    (0xED, I_ACUTE),
+    (0xF1, 0xEE),  # n tilde
+    (0xF3, O_ACUTE),
+    (0xF6, 0xEF),  # o umlaut
+    (0xF7, 0xFD),  # division
+    (0xF8, O_SLASH),
+    (0xFA, U_ACUTE),
+    (0xFC, 0xF5),  # u umlaut
+)
+
+
+def _build_table():
+    table = bytearray(b" " * 256)
+    for b in range(0x20, 0x7F):
+        table[b] = b
+    table[0x5C] = BACKSLASH
+    table[0x7E] = TILDE
+    for i in range(len(_LATIN1_BASE)):
+        table[0xC0 + i] = _LATIN1_BASE[i]
+    for b, code in _LATIN1_SPECIAL:
+        table[b] = code
+    return table
+
+
+LCD_TEXT = _build_table()
+LCD_TEXT_HEART = bytearray(LCD_TEXT)
+LCD_TEXT_HEART[0x2A] = HEART
+
+
+class FieldText:
+    def __init__(self, size=32):
+        self.buffer = bytearray(size)
+        self.length = 0
+
+    def translate(self, msg, start, end, table, compact=False):
+        # Translate msg[start:end] through table into buffer; returns the length, at most the buffer size
+        # With compact, 2 spaces of the first run of 3 are left out, or else 1 space of the first run of 2,
+        # to win characters in each line on the Minilab3
+        buffer = self.buffer
+        size = len(buffer)
+        n = 0
+        run = 0
+        # Where the space to cut is for a run of 2 and for a run of 3
+        cut_2 = -1
+        cut_3 = -1
+        for i in range(start, end):
+            if n == size:
+                break
+            c = table[msg[i]]
+            if c == 0x20:
+                run += 1
+                if run == 2 and cut_2 < 0:
+                    cut_2 = n
+                elif run == 3 and cut_3 < 0:
+                    cut_3 = n - 1
+            else:
+                run = 0
+            buffer[n] = c
+            n += 1
+        if compact:
+            cut = cut_3
+            count = 2
+            if cut < 0:
+                cut = cut_2
+                count = 1
+            if cut >= 0:
+                n -= count
+                for j in range(cut, n):
+                    buffer[j] = buffer[j + count]
+        self.length = n
+        return n
+
+
+if __name__ == "__main__":
+    # Show how some names come out, on the host
+    from host_hal import TextLcd
+    from lcd_framebuffer import LcdFramebuffer
+
+    names = [
+        (b"Brass   Lead", False, True),
+        (b"Pad  Sweep   2", False, True),
+        (b"*Bloody Swing", True, False),
+        (b"C:\\Users\\~synth", False, False),
+        ("Café Ãrpège ñü".encode("latin-1"), False, False),
+    ]
+    lcd = TextLcd()
+    display = LcdFramebuffer(lcd, 2, 16)
+    text = FieldText()
+    for name, heart, compact in names:
+        text.translate(name, 0, len(name), LCD_TEXT_HEART if heart else LCD_TEXT, compact)
+        display.clear()
+        for i in range(text.length):
+            display.write_byte(text.buffer[i])
+        display.dirty = True
+        display.flush()
+        print("{!r:32} -> |{}|".format(name, lcd.lines()[0]))
@@ -0,0 +1,705 @@
+# The controller logic, independent of the hardware it runs on
+#
+# All hardware is accessed through a HAL object with these attributes:
+#   led               - object with a boolean value attribute (the built-in LED shows the menu state)
+#   encoder           - object with a position attribute, like rotaryio.IncrementalEncoder
+#   keys, key_event   - queue of debounced button events like keypad.Keys, and an event to pop them into
+#   held_at_startup   - which buttons were held down at power-on
+#   lcd               - I2cLcd (or something that behaves like it)
+#   midi_in_port      - port with readinto(), like usb_midi.ports[0]
+#   midi_out_port     - port with write(), like usb_midi.ports[1]
+#   monotonic_ns()    - time in ns, since power-on on the device
+#   mem_free()        - free heap in bytes, or None where this is not known
+#   serial_read()     - next character typed on the serial console, or None without waiting
+#   serial_connected() - whether a host is listening on the serial console
+#   ticks_ms()        - time in ms as a small integer that wraps around at 2**29, like supervisor.ticks_ms
+#   gc_collect()      - collect garbage now, like gc.collect
+#   boot_times        - list of (what, ms) that setting up the hardware took, reported by start()
+#
+# pico_hal.py implements this for the Raspberry Pi Pico, host_hal.py with fakes for running
+# the exact same logic on a Linux host (see simulate.py).
+#
+# The steady-state path (encoder, buttons, MIDI in and out, display) works on preallocated buffers and
+# times itself with ticks_ms(), so that it does not allocate; garbage is collected when the loop is idle.
+
+from arturia_sysex import ARTURIA_HEADER, new_fields, parse_set_text, has_heart, SET_TEXT_MINILAB3, SET_DAW_MODE_MACKIE
+from lcd_framebuffer import LcdFramebuffer
+from charset import FieldText, LCD_TEXT, LCD_TEXT_HEART
+from display_scheduler import DisplayScheduler
+from mcu import McuEngine
+from parameters import ParameterTable
+from profiles import PROFILES, IDENTITY_REQUEST
+from settings import MODES
+from midi_trace import TraceRecorder
+from midi_out import MidiOut
+from midi_map import compile_mode, action_key, encode_turn, ENCODER, PRESS, RELEASE, TURN, MENU, SHIFT
+from encoder_reader import EncoderReader
+from midi_framer import MidiFramer
+from log import Log, DEBUG, INFO, WARNING, LEVEL_NAMES, SYSTEM, MIDI_IN, MIDI_OUT, INPUT
+from ticks import ticks_diff
+from instrumentation import Instrumentation, STATS_REQUEST, STATS_DUMP, STATS_RESET, STAGE_OUTPUT, STAGE_ENCODER, STAGE_BUTTONS, STAGE_MIDI_IN, MESSAGES_IN, BYTES_IN, UNKNOWN_EVENTS, SYSEX_TRUNCATED, SYSEX_DROPPED
+
+# Messages that handle_message() compares received bytes with (and IDENTITY_REQUEST, see profiles.py)
+READ_VALUE_PREFIX = ARTURIA_HEADER + b"\x01\x00"
+WRITE_VALUE_PREFIX = ARTURIA_HEADER + b"\x02\x00"
+MCU_BYE = b"\xF0\x00\x00\x66\x14\x08\x00\xF7"
+MINIDEXED = b"MiniDexed"
+
+
+def starts_with(msg, length, prefix):
+    # Compare the start of the first length bytes of msg with prefix without slicing msg
+    if length < len(prefix):
+        return False
+    for i in range(len(prefix)):
+        if msg[i] != prefix[i]:
+            return False
+    return True
+
+
+def equals(msg, length, expected):
+    return length == len(expected) and starts_with(msg, length, expected)
+
+
+def contains(msg, length, needle):
+    # Whether needle occurs anywhere in the first length bytes of msg
+    n = len(needle)
+    first = needle[0]
+    for i in range(length - n + 1):
+        if msg[i] != first:
+            continue
+        for j in range(1, n):
+            if msg[i + j] != needle[j]:
+                break
+        else:
+            return True
+    return False
+
+
+# Idle time after which changed settings are saved when garbage is not collected when idle
+SETTINGS_IDLE_MS = 500
+
+
+class Controller:
+    def __init__(self, hal, profile, mode="arturia", debugging_on=False, encoder_acceleration=False, raw_midi_input=True, instrumentation_on=False, midi_in_budget_ms=2, display_max_fps=30, log_level=INFO, log_rate_limit=50, trace_on=False, trace_path="/trace.bin", gc_idle_ms=500, settings=None):
+        start_ns = hal.monotonic_ns()
+        self.hal = hal
+        self.profile = profile
+        self.mode = mode
+        # The mode is kept across power cycles, see settings.py
+        self.settings = settings
+        self.debugging_on = debugging_on
+        self.raw_midi_input = raw_midi_input
+        self.led = hal.led
+
+        # Messages from the main loop go into a ring buffer and are printed when there is time, see log.py
+        self.log = Log(hal.ticks_ms, level=log_level, rate_limit=log_rate_limit)
+
+        # Draw into a shadow framebuffer; only the cells that changed are written to the LCD
+        lcd = hal.lcd
+        self.display = LcdFramebuffer(lcd, lcd.num_lines, lcd.num_columns)
+        # ...at most display_max_fps times per second, always with the latest frame
+        self.display_scheduler = DisplayScheduler(self.display, display_max_fps)
+
+        self.encoder_reader = EncoderReader(hal.encoder, acceleration=encoder_acceleration)
+        self.buttons = hal.keys
+        self.button_event = hal.key_event
+        self.buttons_pressed = [False, False, False, False, False]
+
+        self.midi_channel = 0
+        if raw_midi_input:
+            # Sysex of any length is received into this buffer, see sysex_assembler.py
+            # Realtime messages (clock, active sensing...) are discarded by the framer before anything else is done
+            self.midi_in = MidiFramer(hal.midi_in_port, message_size=192, filter_realtime=True)
+        else:
+            import adafruit_midi
+            # Apparently all of these imports are necessary for the MIDI sysex message to be recognized
+            # otherwise the message is not recognized as a known MIDI message
+            from adafruit_midi.control_change import ControlChange
+            from adafruit_midi.note_on import NoteOn
+            from adafruit_midi.note_off import NoteOff
+            from adafruit_midi.pitch_bend import PitchBend
+            from adafruit_midi.program_change import ProgramChange
+            from adafruit_midi.start import Start
+            from adafruit_midi.stop import Stop
+            from adafruit_midi.system_exclusive import SystemExclusive
+            from adafruit_midi.timing_clock import TimingClock
+            from adafruit_midi.midi_message import MIDIMessage, MIDIUnknownEvent
+            self.unknown_event = MIDIUnknownEvent
+            # NOTE: If in_buf_size is too small, then MIDIUnknownEvent is received instead of the actual message;
+            # in this case,  need to increase in_buf_size further
+            self.midi = adafruit_midi.MIDI(midi_in=hal.midi_in_port, midi_out=hal.midi_out_port, in_channel=self.midi_channel, out_channel=self.midi_channel, in_buf_size=512, debug=debugging_on)
+        print("MIDI input port:", hal.midi_in_port)
+        print("MIDI input channel:", self.midi_channel)
+        print("MIDI output port:", hal.midi_out_port)
+        print("MIDI output channel:", self.midi_channel)
+
+        # Everything sent during one loop iteration goes out with a single USB write
+        # Running status leaves out repeated status bytes, e.g. for the pairs of CCs sent by the encoder;
+        # it is off by default because USB MIDI event packets always carry complete messages anyway
+        self.midi_out = MidiOut(hal.midi_out_port, running_status=False)
+        # What an MCU host sends is handled by the MCU engine in MCU mode, see mcu.py; set up by update_mcu()
+        self.mcu = None
+
+        # All pending MIDI input is handled in each iteration, unless that takes longer than this
+        self.midi_in_budget_ms = midi_in_budget_ms
+
+        # Longest time one pass through the main loop has taken so far
+        self.worst_loop_ms = 0
+        self.last_loop_ms = None
+        # The same in ns, only used with instrumentation on
+        self.last_loop_ns = None
+
+        # Garbage is collected once the loop has been idle for gc_idle_ms (0 for never), rather than whenever
+        # the heap runs out, which could be in the middle of an encoder turn or a burst of MIDI
+        self.gc_idle_ms = gc_idle_ms
+        self.last_active_ms = hal.ticks_ms()
+        self.collected = False
+        self.gc_collections = 0
+        # Lowest free heap seen right before a collection, i.e. the most that was ever used up between two
+        self.mem_free_low = None
+
+        # Loop timings and traffic counters, see instrumentation.py; when off, none of this costs anything
+        self.stats = None
+        if instrumentation_on:
+            self.stats = Instrumentation(self.midi_out)
+            self.step = self.step_instrumented
+
+        # Line typed on the serial console so far
+        self.console_line = bytearray(32)
+        self.console_length = 0
+
+        # Raw MIDI traffic in both directions, saved to trace_path with the "trace save" console command
+        self.trace = None
+        self.trace_path = trace_path
+        if trace_on:
+            self.trace = TraceRecorder(hal.ticks_ms)
+            self.midi_out.trace = self.trace
+            if raw_midi_input:
+                self.midi_in.trace = self.trace
+
+        # Values the host has written with the Arturia write value sysex, to answer read value requests
+        self.parameters = ParameterTable()
+
+        # Offsets of S1...S4 in the last set text sysex, reused for every message
+        self.set_text_fields = new_fields()
+        # What is drawn of one of those fields, translated for the LCD
+        self.field_text = FieldText()
+
+        print("Checking for button presses...")
+        for i, held in enumerate(hal.held_at_startup):
+            print("Button", i, "pressed:", held)
+        # If the encoder button is pressed, then enter MCU mode
+        if hal.held_at_startup[4]:
+            self.show_mode("mcu")
+        # If button 0 is pressed, then enter DAW mode
+        if hal.held_at_startup[0]:
+            self.show_mode("daw")
+
+        # What each control sends in the current mode, compiled into raw bytes once
+        self.actions = compile_mode(self.mode, self.midi_channel)
+        self.update_mcu()
+        self.init_ms = (hal.monotonic_ns() - start_ns) // 1000000
+
+    def show_mode(self, mode, keep=False):
+        # Only a mode chosen on the serial console is kept; one chosen by holding a button at power-on or
+        # switched to automatically lasts until the next power cycle, so that powering on without holding
+        # a button always gets back to the mode that was kept
+        self.mode = mode
+        if keep and self.settings is not None:
+            # Written to nvm once the loop is idle, see collect_garbage()
+            self.settings.mode = mode
+            self.mark_active(self.hal.ticks_ms())
+        self.actions = compile_mode(mode, self.midi_channel)
+        self.update_mcu()
+        print(mode.upper(), "mode enabled")
+        self.display.clear()
+        self.display.putstr(mode.upper() + " mode enabled")
+
+    def update_mcu(self):
+        # The MCU engine is only needed in MCU mode
+        if self.mode == "mcu":
+            if self.mcu is None:
+                self.mcu = McuEngine(self.display, self.midi_out)
+        else:
+            self.mcu = None
+
+    def control_state(self):
+        state = 0
+        if self.led.value:
+            state |= MENU
+        if self.buttons_pressed[0]:
+            state |= SHIFT
+        return state
+
+    def perform(self, control, event):
+        # Send what the mapping table says for this control and event in the current state
+        action = self.actions.get(action_key(control, event, self.control_state()))
+        if action is not None:
+            self.midi_out.write(action[0])
+            if action[1] is not None:
+                self.led.value = action[1]
+
+    def turn(self, steps):
+        # Send the relative encoder value for all steps at once, in chunks of at most 63 steps
+        action = self.actions.get(action_key(ENCODER, TURN, self.control_state()))
+        if action is None:
+            return
+        data, _, encoding = action
+        while steps != 0:
+            chunk = max(-63, min(63, steps))
+            data[-1] = encode_turn(encoding, chunk)
+            self.midi_out.write(data)
+            steps -= chunk
+
+    def start(self):
+        # Show what has been drawn so far and report how long it took to get here since power-on
+        self.display.flush()
+        print("Ready", self.hal.monotonic_ns() // 1000000, "ms after power-on,", self.hal.mem_free(), "bytes free")
+        for what, ms in self.hal.boot_times:
+            print(" ", what + ":", ms, "ms")
+        print("  controller:", self.init_ms, "ms")
+
+    def run(self):
+        self.start()
+        while True:
+            self.step()
+
+    def step(self):
+        # One pass through the main loop
+        now = self.loop_time()
+        self.flush_output(now)
+        self.poll_encoder(now)
+        self.poll_buttons()
+        self.poll_midi_in()
+        self.poll_console()
+        self.collect_garbage(now)
+
+    def step_instrumented(self):
+        # The same as step(), but timing each stage; replaces step() when instrumentation is on
+        hal = self.hal
+        monotonic_ns = hal.monotonic_ns
+        stats = self.stats
+        t = monotonic_ns()
+        if self.last_loop_ns is not None:
+            stats.loop(t - self.last_loop_ns)
+        self.last_loop_ns = t
+        ticks = self.loop_time()
+        self.flush_output(ticks)
+        now = monotonic_ns()
+        stats.stage(STAGE_OUTPUT, now - t)
+        self.poll_encoder(ticks)
+        t = monotonic_ns()
+        stats.stage(STAGE_ENCODER, t - now)
+        self.poll_buttons()
+        now = monotonic_ns()
+        stats.stage(STAGE_BUTTONS, now - t)
+        if self.poll_midi_in():
+            stats.stage(STAGE_MIDI_IN, monotonic_ns() - now)
+        self.count_sysex_losses()
+        self.poll_console()
+        self.collect_garbage(ticks)
+
+    def count_sysex_losses(self):
+        # Move what the sysex assemblers lost into the instrumentation counters
+        if not self.raw_midi_input:
+            return
+        stats = self.stats
+        sysex = self.midi_in.sysex
+        if sysex.truncated or sysex.dropped:
+            stats.count(SYSEX_TRUNCATED, sysex.truncated)
+            stats.count(SYSEX_DROPPED, sysex.dropped)
+            sysex.truncated = 0
+            sysex.dropped = 0
+
+    def loop_time(self):
+        # Measure the worst-case time between two passes through the loop; returns the time in ticks
+        now = self.hal.ticks_ms()
+        if self.last_loop_ms is not None:
+            elapsed = ticks_diff(now, self.last_loop_ms)
+            if elapsed > self.worst_loop_ms:
+                self.worst_loop_ms = elapsed
+                if self.log.info_on:
+                    self.log.record(INFO, SYSTEM, "Worst-case loop latency: {} ms", elapsed)
+        self.last_loop_ms = now
+        return now
+
+    def mark_active(self, now):
+        # Something happened, so the loop is not idle
+        self.last_active_ms = now
+        self.collected = False
+
+    def collect_garbage(self, now):
+        # Collect garbage once per idle period, when there has been no input for gc_idle_ms and nothing is
+        # waiting to be written to the LCD, and remember how low the free heap got before that;
+        # settings that changed are saved then as well, since rewriting the nvm flash sector stalls everything
+        # (with gc_idle_ms 0, garbage is never collected this way, but settings are still saved when idle)
+        if self.collected or self.display.dirty:
+            return
+        if ticks_diff(now, self.last_active_ms) < (self.gc_idle_ms or SETTINGS_IDLE_MS):
+            return
+        self.collected = True
+        if self.settings is not None:
+            self.settings.save()
+        if not self.gc_idle_ms:
+            return
+        hal = self.hal
+        free = hal.mem_free()
+        if free is not None and (self.mem_free_low is None or free < self.mem_free_low):
+            self.mem_free_low = free
+            if self.log.info_on:
+                self.log.record(INFO, SYSTEM, "Free heap low-water mark: {} bytes", free)
+        hal.gc_collect()
+        self.gc_collections += 1
+
+    def flush_output(self, now):
+        self.send_midi()
+        self.update_display(now)
+
+    def update_display(self, now, max_cells=0):
+        # Draw what changed in MCU mode, and write the latest frame to the LCD if it is time to
+        mcu = self.mcu
+        if mcu is not None and mcu.dirty:
+            mcu.render()
+        return self.display_scheduler.update(now, max_cells)
+
+    def display_overdue(self, now):
+        # Whether the latest frame has waited too long and has to be written now, even if MIDI is waiting
+        mcu = self.mcu
+        if mcu is not None and mcu.dirty:
+            mcu.render()
+        return self.display_scheduler.overdue(now)
+
+    def send_midi(self):
+        # Send whatever was queued during the previous iteration with a single USB write
+        midi_out = self.midi_out
+        sent = midi_out.flush()
+        if sent and self.log.debug_on:
+            self.log.record(DEBUG, MIDI_OUT, "{} bytes; so far {} USB writes", sent, midi_out.writes, data=midi_out.buffer, length=sent)
+
+    def poll_encoder(self, now):
+        # Handle rotary encoder; all detents turned since the last iteration are sent at once
+        steps = self.encoder_reader.read(now)
+        if steps != 0:
+            self.mark_active(now)
+            if self.log.debug_on:
+                self.log.record(DEBUG, INPUT, "Turned {}", steps)
+            self.turn(steps)
+
+    def poll_buttons(self):
+        # Handle the debounced button events that keypad has queued since the last iteration
+        button_event = self.button_event
+        while self.buttons.events.get_into(button_event):
+            self.mark_active(self.hal.ticks_ms())
+            i = button_event.key_number
+            if button_event.pressed:
+                self.buttons_pressed[i] = True
+                if self.log.debug_on:
+                    self.log.record(DEBUG, INPUT, "Button {} pressed", i)
+                self.perform(i, PRESS)
+            else:
+                self.buttons_pressed[i] = False
+                if self.log.debug_on:
+                    self.log.record(DEBUG, INPUT, "Button {} released", i)
+                self.perform(i, RELEASE)
+
+    def poll_midi_in(self):
+        # Handle all pending MIDI messages, so that input does not back up during bursts
+        # (e.g. a set text sysex for every preset step), but stop when the time budget is used up
+        # so that the encoder, buttons and display are still serviced; the rest follows in the next iteration
+        # Returns the number of messages handled
+        ticks_ms = self.hal.ticks_ms
+        budget_ms = self.midi_in_budget_ms
+        stats = self.stats
+        start = ticks_ms()
+        handled = 0
+        while True:
+            length = self.receive_midi()
+            if length == 0:
+                break
+            handled += 1
+            if stats is not None:
+                if length > 0:
+                    stats.count(MESSAGES_IN)
+                    stats.count(BYTES_IN, length)
+                else:
+                    stats.count(UNKNOWN_EVENTS)
+            if ticks_diff(ticks_ms(), start) >= budget_ms:
+                break
+        if handled:
+            self.mark_active(start)
+        return handled
+
+    def poll_console(self):
+        # Print some of the log when there is nothing else to do
+        if self.log.count and self.hal.serial_connected() and self.midi_out.length == 0 and not self.midi_input_pending():
+            self.log.flush(4)
+        # Collect what is typed on the serial console without waiting for it, and run each complete line
+        while True:
+            char = self.hal.serial_read()
+            if char is None:
+                return
+            if char == "\r" or char == "\n":
+                if self.console_length:
+                    self.console_command(self.console_line[:self.console_length].decode())
+                    self.console_length = 0
+            elif self.console_length < len(self.console_line) and ord(char) <= 0x7F:
+                # The commands are ASCII; anything else would not fit in a byte or not decode
+                self.console_line[self.console_length] = ord(char)
+                self.console_length += 1
+
+    def console_command(self, data):
+        # Commands for testing purposes during development
+        # A CC and value separated by a space, each of which could be decimal or hexadecimal, sends that CC
+        # Example: "20 63" or "0x20 0x63"
+        status = 0xB0 | self.midi_channel
+        try:
+            cc, value = data.split()
+            # Convert the strings to integers
+            cc = int(cc, 0)
+            value = int(value, 0)
+            # Send the CC message
+            self.midi_out.write(bytes((status, cc & 0x7F, value & 0x7F)))
+        except ValueError:
+            pass
+        if data == "category" or data == "C":
+            self.midi_out.write(bytes((status, 116, 64)))
+            self.led.value = True
+        if data == "preset" or data == "P":
+            self.midi_out.write(bytes((status, 117, 64)))
+            self.led.value = False
+        if data == "next" or data == "n":
+            self.midi_out.write(bytes((status, 29, 1)))
+        if data == "previous" or data == "p":
+            self.midi_out.write(bytes((status, 28, 1)))
+        if data == "stats" and self.stats is not None:
+            self.stats.dump()
+        if data == "timecode" and self.mcu is not None:
+            self.mcu.show_timecode()
+        if data == "strips" and self.mcu is not None:
+            self.mcu.show_strips(self.mcu.first_strip)
+        if data == "trace save" and self.trace is not None:
+            print("Saved", self.trace.save(self.trace_path), "records to", self.trace_path)
+        if data == "trace clear" and self.trace is not None:
+            self.trace.clear()
+        if data == "log":
+            self.log.flush()
+        # Mode and emulated profile, kept across power cycles; a new profile takes effect after the next one
+        if data.startswith("mode ") and data[5:] in MODES:
+            self.show_mode(data[5:], keep=True)
+        if data.startswith("profile ") and self.settings is not None:
+            name = data[8:]
+            if name in PROFILES and PROFILES[name].pid is None:
+                # boot.py could not set up USB with it
+                print("The USB product ID of", name, "is unknown, it cannot be emulated yet")
+            elif name in PROFILES or name == "default":
+                self.settings.profile = None if name == "default" else name
+                self.mark_active(self.hal.ticks_ms())
+                print("Profile", name, "takes effect after the next power cycle")
+        if data == "latency":
+            # Worst-case time between two passes through the loop since the last "latency"
+            print("Worst-case loop latency:", self.worst_loop_ms, "ms")
+            self.worst_loop_ms = 0
+        if data == "mem":
+            print("Free heap:", self.hal.mem_free(), "bytes, low-water mark:", self.mem_free_low, "bytes,", self.gc_collections, "idle collections")
+        # Log level, e.g. "debug" or "warning"
+        for level, name in LEVEL_NAMES.items():
+            if data == name.lower():
+                self.log.set_level(level)
+
+    def midi_input_pending(self):
+        # Whether the framer still holds bytes that have been read but not handled
+        return self.raw_midi_input and self.midi_in.read_pos < self.midi_in.read_len
+
+    def receive_midi(self):
+        # Check for an incoming MIDI message and handle it
+        # Returns its length, 0 if there was none, or -1 for an unknown event
+        if self.raw_midi_input:
+            length = self.midi_in.receive()
+            if length == 0:
+                return 0
+            data = self.midi_in.data
+            # Meters, timecode and LCD updates in MCU mode are applied straight from the buffer
+            if self.mcu is not None and self.mcu.handle(data, length):
+                return length
+            self.handle_message(data, length)
+            return length
+        message = self.midi.receive()
+        if message is None:
+            return 0
+        # If MIDIUnknownEvent, then print a message explaining how to debug
+        if isinstance(message, self.unknown_event):
+            # See the contents of the message by setting debug=True in the adafruit_midi.MIDI object
+            self.log.record(WARNING, MIDI_IN, "MIDIUnknownEvent received; possibly in_buf_size needs to be further increased")
+            return -1
+        raw = memoryview(message.__bytes__())
+        if self.mcu is not None and self.mcu.handle(raw, len(raw)):
+            return len(raw)
+        self.handle_message(raw, len(raw))
+        return len(raw)
+
+    def handle_message(self, msg, length):
+        # Handle the first length bytes of msg, which may be the framer's buffer; nothing is copied out of it
+        display = self.display
+        profile = self.profile
+        if self.log.debug_on:
+            self.log.record(DEBUG, MIDI_IN, "Received {} bytes:", length, data=msg, length=length)
+        # display.clear()
+        # display.putstr(''.join([f"{b:02X}" for b in bytes]))
+        # print("--> https://www.google.com/search?q=%22" + '+'.join([f"{b:02X}" for b in bytes]) + "%22")
+
+        # If bytes 90 32 00, then print a message on the display
+        if length == 3 and msg[0] == 0x90 and msg[1] == 0x32 and msg[2] == 0x00:
+            display.clear()
+            display.putstr("30 92 00, why?")
+
+        if self.debugging_on:
+            # Print the bytes on the display
+            display.clear()
+            display.putstr(' '.join([f"{msg[i]:02X}" for i in range(length)]))
+
+        # Everything else is sysex
+        if msg[0] != 0xF0:
+            return
+
+        # Instrumentation requests, see instrumentation.py
+        if self.stats is not None and length == 4 and msg[1] == 0x7D:
+            if equals(msg, length, STATS_REQUEST):
+                self.midi_out.write(self.stats.sysex_reply())
+            elif equals(msg, length, STATS_DUMP):
+                self.stats.dump()
+            elif equals(msg, length, STATS_RESET):
+                self.stats.reset()
+            return
+
+        # If the string "MiniDexed" is in the received bytes, then switch to DAW mode
+        if not self.mode == "daw" and contains(msg, length, MINIDEXED):
+            self.show_mode("daw")
+
+        # "Universal Device Request" message
+        if equals(msg, length, IDENTITY_REQUEST):
+            self.log.record(INFO, MIDI_IN, "Request for device ID")
+            # Apparently AnalogLab does not send this, but we might want to support it
+            # e.g., for MiniDexed to find out which device it is connected to
+
+            """
+
+            # When "Mackie Control" is selected in REAPER under "Control/OSC/Web", REAPER sends the following message when exiting:
+            # [f0 00 00 66 14 08 00 f7]
+            # This is from the "Mackie Control Universal" (MCU) protocol
+
+            sysex inquiry 0xF0, 0x7E, 0x7F, 0x06, 0x01, 0xF7.
+            The Keylab Essential 61 responds with 0xF0, 0x7E, 0x7F, 0x06, 0x02, 0x00, 0x20, 0x6B, 0x02, 0x00, 0x05, 0x54, 0xAA, 0xBB, 0xCC, 0xDD, 0xF7 (AA BB CC DD is the firmware version)
+            https://docs.rs/midi-control/latest/midi_control/vendor/arturia/index.html
+            Then it sets the DAW mode into mackie with 0xF0, 0x00, 0x20, 0x6B, 0x7F, 0x42, 0x02, 0x00, 0x40, 0x51, 0x00, 0xF7"""
+
+            # Respond with the identity reply of the emulated device, prebuilt in profiles.py
+            if profile.identity_reply is not None:
+                self.midi_out.write(profile.identity_reply)
+            else:
+                self.log.record(WARNING, MIDI_IN, "FIXME: Respond with the correct device ID for {}", profile.product)
+                display.clear()
+                display.putstr("FIXME: device ID")
+                display.move_to(0, 1)
+                display.putstr("for " + profile.product)
+            # Set the DAW mode into Mackie???
+            self.midi_out.write(SET_DAW_MODE_MACKIE)
+
+        # Check if it starts with the expected header
+        if starts_with(msg, length, ARTURIA_HEADER):
+            if self.log.debug_on:
+                self.log.record(DEBUG, MIDI_IN, "Arturia sysex recognized")
+
+        """
+        Sysex message format used by Arturia KeyLab Essential 61 with AnalogLab to write to the display:
+        F0               # sysex header
+        00 20 6B 7F 42   # Arturia header
+        04 ?? 60         # set text (?? can be 00 for KeyLab Essential or 02 for Minilab3 and possibly other values)
+        01 S1 00         # S1 = Instrument (e.g. 'ARP 2600')
+        02 S2 00         # S2 = Name (e.g. 'Bloody Swing')
+        03 S3 00         # S3 = Type (e.g. 'Noise')
+        04 S4 00         # S4 = Whether to display a heart (if 46 20, then display a heart; if nonexistent, then do not display a heart) - OPTIONAL
+        F7               # sysex footer
+
+        Example with heart:
+        F0 00 20 6B 7F 42 04 00 60 01 41 52 50 20 32 36 30 30 00 02 2A 42 6C 6F 6F 64 79 20 53 77 69 6E 67 00 03 4E 6F 69 73 65 00 04 46 20 00 F7
+        Example without heart:
+        F0 00 20 6B 7F 42 04 00 60 01 41 52 50 20 32 36 30 30 00 02 2A 42 6C 6F 6F 64 79 20 53 77 69 6E 67 00 03 4E 6F 69 73 65 00 04 00 F7
+        Example with Minilab3 alternative format:
+        F0 00 20 6B 7F 42 04 02 60 1F 07 01 00 00 01 00 01 Line1 00 02 Line2 00 F7
+        """
+
+        # Walk the payload once and only record where S1...S4 are; the text is drawn straight from msg
+        if parse_set_text(msg, self.set_text_fields, length) >= 0:
+            if self.log.debug_on:
+                self.log.record(DEBUG, MIDI_IN, "Set text sysex recognized")
+            # If the bytes are 46 20, then it is a heart
+            heart = has_heart(msg, self.set_text_fields)
+            if heart:
+                if self.log.debug_on:
+                    self.log.record(DEBUG, MIDI_IN, "Heart")
+            else:
+                if self.log.debug_on:
+                    self.log.record(DEBUG, MIDI_IN, "No heart")
+            display.clear()
+            display.move_to(0, 0)
+            self.draw_field(msg, 0, False)
+            display.move_to(0, 1)
+            # Replace the "*" ASCII character in S2 with the heart symbol
+            self.draw_field(msg, 1, heart)
+            if display.num_lines > 2:
+                # Graphical displays (see oled.py) have room for the type, too
+                display.move_to(0, 2)
+                self.draw_field(msg, 2, False)
+            #except:
+            #    print("Error processing sysex message")
+        # 01 - Read value
+        # F0 00 20 6B 7F 42 01 00 pp bb
+        # pp = parameter number
+        # bb = button id
+        if length >= 10 and starts_with(msg, length, READ_VALUE_PREFIX):
+            pp = msg[8]
+            bb = msg[9]
+            if self.log.debug_on:
+                self.log.record(DEBUG, MIDI_IN, "Read value; parameter number: {}, button id: {}", pp, bb)
+            # Answer with the last value the host wrote, see parameters.py
+            self.midi_out.write(self.parameters.read_reply(pp, bb))
+        # 02 - Write value
+        # F0 00 20 6B 7F 42 02 00 pp bb vv F7
+        # pp = parameter number
+        # bb = button id
+        # vv = value
+        if length >= 11 and starts_with(msg, length, WRITE_VALUE_PREFIX):
+            pp = msg[8]
+            bb = msg[9]
+            vv = msg[10]
+            self.parameters.set(pp, bb, vv)
+
+            if bb == 89:
+                # AnalogLab is closing
+                display.clear()
+                display.putstr("Bye AnalogLab")
+                return
+
+            if self.log.debug_on:
+                self.log.record(DEBUG, MIDI_IN, "Write value; parameter number: {}, button id: {}, message:", pp, bb, data=msg, length=length)
+
+        if equals(msg, length, MCU_BYE):
+            self.log.record(INFO, MIDI_IN, "Bye Mackie Control Universal mode")
+            display.clear()
+            display.putstr("Bye MCU mode")
+
+    def draw_field(self, msg, n, heart):
+        # Draw field n of the set text sysex in msg (0 = S1) at the cursor, translated for the LCD (see charset.py)
+        # With heart, "*" is drawn as the heart glyph, which the framebuffer loads into CGRAM when needed
+        fields = self.set_text_fields
+        start = fields[2 * n]
+        if start < 0:
+            return
+        # If we are emulating Minilab3, then we need to remove extraneous spaces to win ideally 2 characters in each line
+        text = self.field_text
+        text.translate(msg, start, fields[2 * n + 1], LCD_TEXT_HEART if heart else LCD_TEXT, self.profile.set_text_layout == SET_TEXT_MINILAB3)
+        display = self.display
+        buffer = text.buffer
+        for i in range(text.length):
+            display.write_byte(buffer[i])
+        display.dirty = True
@@ -0,0 +1,114 @@
+# Latest-wins display scheduler with a capped refresh rate
+#
+# When the encoder is spun quickly, AnalogLab sends a set text sysex for every step, and writing every one
+# of them to the LCD over I2C throttles the whole loop. Drawing only goes into the LcdFramebuffer, which
+# always holds the most recent frame; the scheduler writes it to the LCD at most max_fps times per second.
+# Intermediate frames are never written, but the last one always is, at most 1 / max_fps later.
+#
+# Times are in ms from supervisor.ticks_ms(), see ticks.py.
+
+from ticks import ticks_diff
+
+
+class DisplayScheduler:
+    def __init__(self, display, max_fps=30):
+        self.display = display
+        # 0 means no cap, i.e. flush in every loop iteration
+        self.interval_ms = 1000 // max_fps if max_fps else 0
+        self.last_flush_ms = None
+        # When the frame that is waiting to be written was first seen, or None
+        self.pending_since_ms = None
+        self.flushes = 0
+        # Time from drawing to writing the last frame, and the longest such time so far
+        self.last_latency_ms = 0
+        self.max_latency_ms = 0
+
+    def overdue(self, now):
+        # Whether the waiting frame has been held back for a whole frame longer than the cap allows, so that it
+        # is written even while something with priority (MIDI) keeps the caller from writing it otherwise;
+        # with no cap, that is right away
+        if not self.display.dirty:
+            return False
+        if self.pending_since_ms is None:
+            self.pending_since_ms = now
+        return ticks_diff(now, self.pending_since_ms) >= 2 * self.interval_ms
+
+    def wait_ms(self, now, idle_ms):
+        # How long the caller can sleep before the next update() may write something; idle_ms if nothing is waiting
+        if not self.display.dirty:
+            return idle_ms
+        if self.last_flush_ms is None:
+            return 0
+        return max(0, self.interval_ms - ticks_diff(now, self.last_flush_ms))
+
+    def update(self, now, max_cells=0):
+        # Called once per loop iteration; returns the number of cells written to the LCD
+        # With max_cells, the frame is written in parts of that many cells, one per call
+        display = self.display
+        if not display.dirty:
+            return 0
+        if self.pending_since_ms is None:
+            self.pending_since_ms = now
+        if self.last_flush_ms is not None and ticks_diff(now, self.last_flush_ms) < self.interval_ms:
+            return 0
+        written = display.flush(max_cells)
+        if display.dirty:
+            # Only part of the frame was written
+            return written
+        self.flushes += 1
+        self.last_flush_ms = now
+        latency = ticks_diff(now, self.pending_since_ms)
+        self.last_latency_ms = latency
+        if latency > self.max_latency_ms:
+            self.max_latency_ms = latency
+        self.pending_since_ms = None
+        return written
+
+
+if __name__ == "__main__":
+    # Simulated burst: the encoder is spun quickly and AnalogLab sends a new preset name every few ms.
+    # Time is simulated; every LCD command or data write is assumed to take as long as it does over I2C
+    # with the PCF8574 backpack at 100 kHz (4 transactions of 2 bytes), and every loop iteration 100 us.
+    from host_hal import TextLcd
+    from lcd_framebuffer import LcdFramebuffer
+
+    LCD_WRITE_NS = 4 * 2 * 9 * 10000
+    LOOP_NS = 100000
+    FRAME_INTERVAL_NS = 2000000
+    FRAMES = 100
+    instruments = ("ARP 2600", "Jupiter-8", "Mini V", "Prophet-5", "CS-80", "DX7")
+    names = ("Bloody Swing", "Brass Section", "Bright Pad", "Noise Sweep", "Soft Strings", "Bass Line", "Lead")
+    frames = [(instruments[i // 7 % len(instruments)], names[i % len(names)]) for i in range(FRAMES)]
+
+    def burst(max_fps):
+        # max_fps None: every frame is written right away, like before
+        lcd = TextLcd()
+        display = LcdFramebuffer(lcd, 2, 16)
+        scheduler = DisplayScheduler(display, max_fps or 0)
+        now = 0
+        sent = 0
+        last_sent_ns = 0
+        while True:
+            writes = lcd.commands + lcd.data_writes
+            # Everything that has arrived by now is handled, i.e. drawn into the framebuffer
+            while sent < FRAMES and sent * FRAME_INTERVAL_NS <= now:
+                display.clear()
+                display.putstr(frames[sent][0])
+                display.move_to(0, 1)
+                display.putstr(frames[sent][1])
+                last_sent_ns = sent * FRAME_INTERVAL_NS
+                sent += 1
+                if max_fps is None:
+                    scheduler.update(now // 1000000)
+            scheduler.update(now // 1000000)
+            now += LOOP_NS + (lcd.commands + lcd.data_writes - writes) * LCD_WRITE_NS
+            if sent == FRAMES and not display.dirty:
+                break
+        assert lcd.lines()[1].rstrip() == frames[-1][1]
+        return scheduler.flushes, lcd.commands + lcd.data_writes, (now - last_sent_ns) / 1000000
+
+    print("{} frames, one every {} ms:".format(FRAMES, FRAME_INTERVAL_NS // 1000000))
+    for max_fps in (None, 0, 60, 30, 15):
+        flushes, writes, latency = burst(max_fps)
+        label = "every frame" if max_fps is None else "{} fps".format(max_fps) if max_fps else "uncapped"
+        print("{:>11}: {:3d} redraws, {:4d} LCD writes, last frame on the glass {:5.1f} ms after it arrived".format(label, flushes, writes, latency))
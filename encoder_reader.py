@@ -0,0 +1,42 @@
+# Reads the full movement of the rotary encoder since the last poll
+#
+# When the loop is slow (e.g. while parsing sysex or writing to the LCD), several detents
+# can be turned between two polls. Instead of one event per poll, the whole delta is returned,
+# optionally accelerated depending on how fast the encoder is turned, so that scrolling
+# through thousands of presets takes a few flicks rather than hundreds of detents.
+
+from ticks import ticks_diff
+
+# (minimum time per detent in ms, steps per detent), from slow to fast
+ACCELERATION = (
+    (60, 1),
+    (30, 2),
+    (15, 4),
+    (0, 8),
+)
+
+
+class EncoderReader:
+    def __init__(self, encoder, acceleration=False):
+        self.encoder = encoder
+        self.acceleration = acceleration
+        self.last_position = encoder.position
+        self.last_turn_ms = None
+
+    def read(self, now_ms):
+        # Returns the (accelerated) number of steps turned since the last call, negative for counterclockwise
+        position = self.encoder.position
+        delta = position - self.last_position
+        if delta == 0:
+            return 0
+        self.last_position = position
+        last_turn_ms = self.last_turn_ms
+        self.last_turn_ms = now_ms
+        if not self.acceleration or last_turn_ms is None:
+            return delta
+        detents = delta if delta > 0 else -delta
+        per_detent_ms = ticks_diff(now_ms, last_turn_ms) // detents
+        for minimum_ms, steps in ACCELERATION:
+            if per_detent_ms >= minimum_ms:
+                return delta * steps
+        return delta
@@ -0,0 +1,181 @@
+# Custom characters for the HD44780, managed in its 8 CGRAM slots
+#
+# The character ROM has no heart, no up and down arrows and few accented letters, but the LCD can hold 8
+# user-defined 5x8 characters at a time. Drawing code puts the glyph codes below into the framebuffer, like
+# any other character. Before each flush, GlyphCache loads the glyphs that the frame uses into CGRAM slots,
+# evicting the least recently used glyphs the frame does not need, and table maps every frame byte to what
+# is written to the LCD: glyph codes to their slot, everything else to itself. A glyph that is already
+# loaded costs no I2C traffic, and the cells showing it do not change as long as it stays in its slot.
+#
+# If a frame uses more different glyphs than there are slots, the rest are shown as a similar ROM character.
+
+# Codes 80...9F are blank in the A00 character ROM, so they are free to be used for glyphs
+GLYPH_FIRST = 0x80
+
+HEART = 0x80
+ARROW_UP = 0x81
+ARROW_DOWN = 0x82
+MENU_MARKER = 0x83
+E_ACUTE = 0x84
+E_GRAVE = 0x85
+E_CIRCUMFLEX = 0x86
+A_ACUTE = 0x87
+A_GRAVE = 0x88
+A_RING = 0x89
+C_CEDILLA = 0x8A
+I_ACUTE = 0x8B
+O_ACUTE = 0x8C
+O_SLASH = 0x8D
+U_ACUTE = 0x8E
+# The ROM has a yen sign and a right arrow where ASCII has these
+BACKSLASH = 0x8F
+TILDE = 0x90
+
+# 5x8 bitmaps, one byte per row, top first, in the order of the codes above
+GLYPHS = (
+    b"\x00\x0a\x1f\x1f\x0e\x04\x00\x00",  # heart
+    b"\x04\x0e\x15\x04\x04\x04\x04\x00",  # arrow up
+    b"\x04\x04\x04\x04\x15\x0e\x04\x00",  # arrow down
+    b"\x10\x18\x1c\x1e\x1c\x18\x10\x00",  # menu marker
+    b"\x02\x04\x0e\x11\x1f\x10\x0e\x00",  # é
+    b"\x08\x04\x0e\x11\x1f\x10\x0e\x00",  # è
+    b"\x04\x0a\x0e\x11\x1f\x10\x0e\x00",  # ê
+    b"\x02\x04\x0e\x01\x0f\x11\x0f\x00",  # á
+    b"\x08\x04\x0e\x01\x0f\x11\x0f\x00",  # à
+    b"\x04\x0a\x0e\x01\x0f\x11\x0f\x00",  # å
+    b"\x00\x0e\x10\x10\x11\x0e\x04\x0c",  # ç
+    b"\x02\x04\x0c\x04\x04\x04\x0e\x00",  # í
+    b"\x02\x04\x0e\x11\x11\x11\x0e\x00",  # ó
+    b"\x00\x01\x0e\x13\x15\x19\x0e\x10",  # ø
+    b"\x02\x04\x11\x11\x11\x13\x0d\x00",  # ú
+    b"\x00\x10\x08\x04\x02\x01\x00\x00",  # backslash
+    b"\x00\x00\x08\x15\x02\x00\x00\x00",  # tilde
+)
+
+# ROM characters shown instead when a glyph does not get a slot
+FALLBACKS = b"*^v>eeeaaacioou/-"
+
+SLOTS = 8
+
+_EMPTY = 0xFF
+
+
+class GlyphCache:
+    def __init__(self, lcd):
+        self.lcd = lcd
+        # Glyph (index into GLYPHS) held by each slot, or _EMPTY
+        self.slot_glyph = bytearray(b"\xFF" * SLOTS)
+        # When each slot was last needed by a frame, for least recently used eviction
+        self.slot_used = [0] * SLOTS
+        self.clock = 0
+        # What is written to the LCD for each byte in the frame
+        self.table = bytearray(range(256))
+        for glyph in range(len(GLYPHS)):
+            self.table[GLYPH_FIRST + glyph] = FALLBACKS[glyph]
+        # Glyphs the frame being loaded needs, reused for every frame
+        self.needed = bytearray(len(GLYPHS))
+        # Glyphs written to CGRAM, and glyphs shown as fallbacks for lack of a free slot
+        self.uploads = 0
+        self.fallbacks = 0
+
+    def load(self, frame):
+        # Load every glyph that frame uses into a slot and update table; returns the number of glyphs uploaded
+        needed = self.needed
+        count = len(GLYPHS)
+        found = False
+        for b in frame:
+            glyph = b - GLYPH_FIRST
+            if 0 <= glyph < count:
+                needed[glyph] = 1
+                found = True
+        if not found:
+            return 0
+        self.clock += 1
+        clock = self.clock
+        slot_glyph = self.slot_glyph
+        slot_used = self.slot_used
+        # Glyphs already loaded stay where they are
+        for slot in range(SLOTS):
+            glyph = slot_glyph[slot]
+            if glyph != _EMPTY and needed[glyph]:
+                needed[glyph] = 0
+                slot_used[slot] = clock
+        uploaded = 0
+        for glyph in range(count):
+            if not needed[glyph]:
+                continue
+            needed[glyph] = 0
+            slot = self._free_slot(clock)
+            if slot < 0:
+                self.fallbacks += 1
+                continue
+            evicted = slot_glyph[slot]
+            if evicted != _EMPTY:
+                self.table[GLYPH_FIRST + evicted] = FALLBACKS[evicted]
+            slot_glyph[slot] = glyph
+            slot_used[slot] = clock
+            self.table[GLYPH_FIRST + glyph] = slot
+            self.lcd.custom_char(slot, GLYPHS[glyph])
+            uploaded += 1
+        self.uploads += uploaded
+        return uploaded
+
+    def _free_slot(self, clock):
+        # An empty slot, or else the least recently used slot that the current frame does not need, or -1
+        slot_glyph = self.slot_glyph
+        slot_used = self.slot_used
+        oldest = -1
+        for slot in range(SLOTS):
+            if slot_glyph[slot] == _EMPTY:
+                return slot
+            if slot_used[slot] != clock and (oldest < 0 or slot_used[slot] < slot_used[oldest]):
+                oldest = slot
+        return oldest
+
+    def forget(self, slot):
+        # The slot was written with something else, e.g. with LcdFramebuffer.custom_char()
+        glyph = self.slot_glyph[slot]
+        if glyph != _EMPTY:
+            self.table[GLYPH_FIRST + glyph] = FALLBACKS[glyph]
+            self.slot_glyph[slot] = _EMPTY
+
+
+if __name__ == "__main__":
+    # Count the CGRAM uploads for a sequence of preset changes, compared with uploading the heart every time
+    from host_hal import TextLcd
+    from lcd_framebuffer import LcdFramebuffer
+
+    presets = [
+        ("ARP 2600", b"\x80Bloody Swing"),
+        ("ARP 2600", b"\x80Bloody Sweep"),
+        ("Jupiter-8", b"Brass Section"),
+        ("Jupiter-8", b"\x80Bright Pad"),
+        ("Piano V", b"Caf\x84 Ros\x84"),
+        ("Piano V", b"\x80Caf\x84 \x8Aa Va"),
+    ]
+
+    def check_glass(lcd, display):
+        # What the framebuffer believes is on the glass must be what the LCD's display RAM holds
+        for y in range(display.num_lines):
+            start = 0x40 if y & 1 else 0
+            row = bytes(display.glass[y * display.num_columns:(y + 1) * display.num_columns])
+            assert row == bytes(lcd.ddram[start:start + display.num_columns]), (y, row, lcd.lines())
+
+    lcd = TextLcd()
+    display = LcdFramebuffer(lcd, 2, 16)
+    # A frame without glyphs that is only partly written when the next one arrives
+    display.putstr("ARP 2600")
+    display.flush(4)
+    check_glass(lcd, display)
+    for instrument, name in presets:
+        display.clear()
+        display.putstr(instrument)
+        display.move_to(0, 1)
+        display.putstr(name)
+        # In parts of 4 cells, as the asyncio display task does, so that glyphs are uploaded between cell writes
+        while display.dirty:
+            display.flush(4)
+            check_glass(lcd, display)
+        print("|" + lcd.lines()[1] + "|")
+    every_time = sum(1 for _, name in presets if name[0] == HEART)
+    print("CGRAM uploads: {} with the cache, {} uploading the heart for every preset".format(display.glyphs.uploads, every_time))
@@ -0,0 +1,204 @@
+# Fakes of the Raspberry Pi Pico hardware, for running controller.py on a Linux host
+# with CPython, e.g. under cProfile and tracemalloc (see simulate.py)
+
+import time
+from collections import deque
+
+
+class FakeLed:
+    def __init__(self):
+        self.value = False
+
+
+class ScriptedEncoder:
+    # Like rotaryio.IncrementalEncoder; turn() moves it
+    def __init__(self):
+        self.position = 0
+
+    def turn(self, detents):
+        self.position += detents
+
+
+class KeyEvent:
+    # Like keypad.Event
+    def __init__(self, key_number=0, pressed=True, timestamp=0):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.released = not pressed
+        self.timestamp = timestamp
+
+
+class EventQueue:
+    # Like keypad.EventQueue
+    def __init__(self):
+        self.queue = deque()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def get_into(self, event):
+        if not self.queue:
+            return False
+        event.key_number, event.pressed, event.timestamp = self.queue.popleft()
+        event.released = not event.pressed
+        return True
+
+
+class ScriptedKeys:
+    # Like keypad.Keys; press(), release() and click() queue events as if the buttons were used
+    def __init__(self):
+        self.events = EventQueue()
+
+    def press(self, key_number):
+        self.events.queue.append((key_number, True, time.monotonic_ns() // 1000000))
+
+    def release(self, key_number):
+        self.events.queue.append((key_number, False, time.monotonic_ns() // 1000000))
+
+    def click(self, key_number):
+        self.press(key_number)
+        self.release(key_number)
+
+
+class TextLcd:
+    # In-memory stand-in for I2cLcd that keeps the HD44780 display RAM and renders it as text
+    def __init__(self, num_lines=2, num_columns=16):
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.ddram = bytearray(b" " * 0x80)
+        self.cgram = [bytes(8) for _ in range(8)]
+        self.address = 0
+        self.cursor_x = 0
+        self.cursor_y = 0
+        self.backlight = True
+        # Number of HD44780 commands and data writes, each of which is several I2C transactions on the real thing
+        self.commands = 0
+        self.data_writes = 0
+
+    def clear(self):
+        self.commands += 2
+        for i in range(len(self.ddram)):
+            self.ddram[i] = 0x20
+        self.address = 0
+        self.cursor_x = 0
+        self.cursor_y = 0
+
+    def move_to(self, cursor_x, cursor_y):
+        self.commands += 1
+        self.cursor_x = cursor_x
+        self.cursor_y = cursor_y
+        address = cursor_x & 0x3F
+        if cursor_y & 1:
+            address += 0x40
+        if cursor_y & 2:
+            address += self.num_columns
+        self.address = address
+
+    def hal_write_data(self, data):
+        self.data_writes += 1
+        self.ddram[self.address & 0x7F] = data
+        self.address += 1
+
+    def putchar(self, char):
+        # Same line wrapping as LcdApi.putchar
+        if char == "\n":
+            self.cursor_x = self.num_columns
+        else:
+            self.hal_write_data(ord(char))
+            self.cursor_x += 1
+        if self.cursor_x >= self.num_columns:
+            self.cursor_x = 0
+            self.cursor_y += 1
+            if self.cursor_y >= self.num_lines:
+                self.cursor_y = 0
+            self.move_to(self.cursor_x, self.cursor_y)
+
+    def putstr(self, string):
+        for char in string:
+            self.putchar(char)
+
+    def custom_char(self, location, charmap):
+        self.commands += 1
+        self.data_writes += 8
+        self.cgram[location & 0x7] = bytes(charmap)
+        self.move_to(self.cursor_x, self.cursor_y)
+
+    def lines(self):
+        # The text on the glass; custom characters are shown as circled digits
+        lines = []
+        for y in range(self.num_lines):
+            start = (0x40 if y & 1 else 0) + (self.num_columns if y & 2 else 0)
+            cells = self.ddram[start:start + self.num_columns]
+            lines.append("".join(chr(0x2460 + b) if b < 8 else chr(b) for b in cells))
+        return lines
+
+
+class QueuePort:
+    # USB MIDI port backed by byte queues: feed() what the host sends, read sent for what was written
+    def __init__(self):
+        self.incoming = bytearray()
+        self.sent = bytearray()
+        self.writes = 0
+
+    def feed(self, data):
+        self.incoming += data
+
+    def readinto(self, buf, nbytes=None):
+        n = len(buf) if nbytes is None else nbytes
+        n = min(n, len(self.incoming))
+        if n == 0:
+            return None
+        buf[:n] = self.incoming[:n]
+        del self.incoming[:n]
+        return n
+
+    def write(self, buf, nbytes=None):
+        if nbytes is None:
+            nbytes = len(buf)
+        self.sent += buf[:nbytes]
+        self.writes += 1
+        return nbytes
+
+
+class HostHal:
+    def __init__(self, held_at_startup=(False, False, False, False, False), num_lines=2, num_columns=16):
+        self.led = FakeLed()
+        self.encoder = ScriptedEncoder()
+        self.keys = ScriptedKeys()
+        self.key_event = KeyEvent()
+        self.held_at_startup = list(held_at_startup)
+        self.lcd = TextLcd(num_lines, num_columns)
+        self.midi_in_port = QueuePort()
+        self.midi_out_port = QueuePort()
+        self.monotonic_ns = time.monotonic_ns
+        self.gc_collections = 0
+        self.boot_times = []
+        # What is typed on the serial console
+        self.serial_input = deque()
+
+    def mem_free(self):
+        return None
+
+    def gc_collect(self):
+        # CPython collects by reference counting anyway
+        self.gc_collections += 1
+
+    def ticks_ms(self):
+        return time.monotonic_ns() // 1000000 & (1 << 29) - 1
+
+    def serial_connected(self):
+        return True
+
+    def serial_read(self):
+        return self.serial_input.popleft() if self.serial_input else None
+
+
+def set_text_sysex(instrument, name, kind="", heart=False):
+    # The set text sysex AnalogLab sends to a KeyLab Essential, see arturia_sysex.py
+    data = bytearray(b"\xF0\x00\x20\x6B\x7F\x42\x04\x00\x60")
+    data += b"\x01" + instrument.encode() + b"\x00"
+    data += b"\x02" + name.encode() + b"\x00"
+    data += b"\x03" + kind.encode() + b"\x00"
+    data += b"\x04\x46\x20\x00" if heart else b"\x04\x00"
+    data += b"\xF7"
+    return bytes(data)
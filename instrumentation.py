@@ -0,0 +1,122 @@
+# Lightweight instrumentation of the main loop
+#
+# Keeps a fixed-size histogram of the time between two passes through the loop, the time spent
+# in each stage of the loop, and MIDI traffic counters. Nothing is allocated while recording.
+# When instrumentation is off, the controller does not call any of this at all (see Controller.step).
+#
+# Note that on the device, time.monotonic_ns() returns a long integer, which is allocated on the heap;
+# this is why instrumentation is off by default.
+#
+# The statistics can be queried over MIDI with sysex messages using the non-commercial manufacturer ID 7D:
+#
+# F0 7D 01 F7   Request statistics; the reply is F0 7D 01 followed by the values listed in values(),
+#               each as 4 bytes of 7 bits, most significant first (saturated at 2^28 - 1), then F7
+# F0 7D 02 F7   Print the statistics on the serial console
+# F0 7D 03 F7   Reset the statistics
+
+STATS_REQUEST = b"\xF0\x7D\x01\xF7"
+STATS_DUMP = b"\xF0\x7D\x02\xF7"
+STATS_RESET = b"\xF0\x7D\x03\xF7"
+
+# Upper bounds of the histogram buckets in us; the last bucket takes everything above
+HISTOGRAM_BOUNDS = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+
+# Stages of the main loop
+STAGE_OUTPUT = 0   # Flushing MIDI out and the display
+STAGE_ENCODER = 1
+STAGE_BUTTONS = 2
+STAGE_MIDI_IN = 3  # Receiving and handling the pending MIDI messages
+STAGE_NAMES = ("output", "encoder", "buttons", "midi in")
+
+# Counters
+MESSAGES_IN = 0
+BYTES_IN = 1
+UNKNOWN_EVENTS = 2   # MIDIUnknownEvent from adafruit_midi
+SYSEX_TRUNCATED = 3  # Sysex that was cut short to fit, see sysex_assembler.py
+SYSEX_DROPPED = 4    # Sysex that was dropped because it did not fit, or interrupted by another status byte
+COUNTER_NAMES = ("messages in", "bytes in", "unknown events", "sysex truncated", "sysex dropped")
+
+_VALUE_MAX = (1 << 28) - 1
+
+
+class Instrumentation:
+    def __init__(self, midi_out=None):
+        # MidiOut, which counts the outgoing messages, writes and bytes itself
+        self.midi_out = midi_out
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.stage_count = [0] * len(STAGE_NAMES)
+        self.stage_total_us = [0] * len(STAGE_NAMES)
+        self.stage_max_us = [0] * len(STAGE_NAMES)
+        self.counters = [0] * len(COUNTER_NAMES)
+        self.max_loop_us = 0
+        n = len(self.values())
+        self.reply = bytearray(3 + 4 * n + 1)
+        self.reply[0:3] = STATS_REQUEST[0:3]
+        self.reply[-1] = 0xF7
+
+    def reset(self):
+        for values in (self.histogram, self.stage_count, self.stage_total_us, self.stage_max_us, self.counters):
+            for i in range(len(values)):
+                values[i] = 0
+        self.max_loop_us = 0
+
+    def loop(self, ns):
+        # Record the time between two passes through the loop
+        us = ns // 1000
+        if us > self.max_loop_us:
+            self.max_loop_us = us
+        i = 0
+        for bound in HISTOGRAM_BOUNDS:
+            if us < bound:
+                break
+            i += 1
+        self.histogram[i] += 1
+
+    def stage(self, stage, ns):
+        us = ns // 1000
+        self.stage_count[stage] += 1
+        self.stage_total_us[stage] += us
+        if us > self.stage_max_us[stage]:
+            self.stage_max_us[stage] = us
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def values(self):
+        # Histogram, then count, total and maximum us for each stage, then the counters,
+        # the longest loop in us, and the messages, USB writes and bytes sent
+        midi_out = self.midi_out
+        out = (midi_out.messages, midi_out.writes, midi_out.bytes) if midi_out is not None else (0, 0, 0)
+        return self.histogram + self.stage_count + self.stage_total_us + self.stage_max_us + self.counters + [self.max_loop_us] + list(out)
+
+    def sysex_reply(self):
+        # Reply to STATS_REQUEST
+        reply = self.reply
+        i = 3
+        for value in self.values():
+            if value > _VALUE_MAX:
+                value = _VALUE_MAX
+            reply[i] = value >> 21 & 0x7F
+            reply[i + 1] = value >> 14 & 0x7F
+            reply[i + 2] = value >> 7 & 0x7F
+            reply[i + 3] = value & 0x7F
+            i += 4
+        return reply
+
+    def dump(self):
+        # Print the statistics on the serial console
+        total = sum(self.histogram)
+        print("Loop iterations:", total, "longest:", self.max_loop_us, "us")
+        lower = 0
+        for bound, n in zip(HISTOGRAM_BOUNDS + (None,), self.histogram):
+            label = "{:>6}...{} us".format(lower, bound) if bound is not None else "{:>6}... us".format(lower)
+            print(" ", label, n)
+            lower = bound
+        for stage, name in enumerate(STAGE_NAMES):
+            count = self.stage_count[stage]
+            average = self.stage_total_us[stage] // count if count else 0
+            print(" ", name + ":", count, "times, average", average, "us, max", self.stage_max_us[stage], "us")
+        for counter, name in enumerate(COUNTER_NAMES):
+            print(" ", name + ":", self.counters[counter])
+        if self.midi_out is not None:
+            print("  messages out:", self.midi_out.messages, "in", self.midi_out.writes, "USB writes,", self.midi_out.bytes, "bytes")
@@ -0,0 +1,157 @@
+# Shadow framebuffer for the HD44780 character LCD
+#
+# Every character written through I2cLcd costs several nibble-mode I2C transactions on the
+# PCF8574 backpack, and lcd.clear() alone takes milliseconds. Drawing goes into a framebuffer
+# instead, and flush() compares it with what is on the glass and only writes the cells that
+# changed, with a cursor move only where the changed cells are not contiguous.
+#
+# The interface mirrors the parts of LcdApi that code.py uses (clear, move_to, putstr,
+# custom_char), so drawing code reads the same as before plus a flush() at the end.
+#
+# Custom characters are drawn as the glyph codes in glyphs.py; flush() loads them into CGRAM as needed.
+#
+# Any display with the same interface as I2cLcd works: num_lines, num_columns, clear(), move_to(),
+# hal_write_data() and custom_char(). Displays that collect the writes and send them later, like OledLcd in
+# oled.py, also have show(), which flush() calls after writing the changed cells.
+
+from glyphs import GlyphCache
+
+
+class LcdFramebuffer:
+    def __init__(self, lcd, num_lines, num_columns):
+        self.lcd = lcd
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.frame = bytearray(b" " * (num_lines * num_columns))
+        self.glass = bytearray(self.frame)
+        self.cursor = 0
+        # Cell the LCD would write to next, or -1 if unknown
+        self.lcd_cursor = -1
+        # Whether anything was drawn since the last flush()
+        self.dirty = False
+        self.glyphs = GlyphCache(lcd)
+        self.show = getattr(lcd, "show", None)
+        lcd.clear()
+
+    def clear(self):
+        frame = self.frame
+        for i in range(len(frame)):
+            frame[i] = 0x20
+        self.cursor = 0
+        self.dirty = True
+
+    def move_to(self, cursor_x, cursor_y):
+        self.cursor = cursor_y * self.num_columns + cursor_x
+
+    def putchar(self, char):
+        self.write_byte(ord(char))
+        self.dirty = True
+
+    def write_byte(self, b):
+        # Like LcdApi.putchar, text wraps to the next line and back to the top
+        if self.cursor >= len(self.frame):
+            self.cursor = 0
+        self.frame[self.cursor] = b
+        self.cursor += 1
+
+    def putstr(self, string):
+        # Accepts str as well as bytes, bytearray or memoryview
+        self.dirty = True
+        if isinstance(string, str):
+            for char in string:
+                self.write_byte(ord(char))
+        else:
+            for b in string:
+                self.write_byte(b)
+
+    def custom_char(self, location, charmap):
+        # The slot is taken away from the glyph cache
+        self.glyphs.forget(location)
+        # LcdApi moves the cursor back to where it thinks it is, which may not be where we left it
+        self.lcd.custom_char(location, charmap)
+        self.lcd_cursor = -1
+
+    def invalidate(self):
+        # Forget what is on the glass, e.g. after the LCD was written to directly
+        glass = self.glass
+        for i in range(len(glass)):
+            glass[i] = 0xFF
+        self.lcd_cursor = -1
+        self.dirty = True
+
+    def flush(self, max_cells=0):
+        # Write the changed cells to the LCD and return how many cells were written
+        # With max_cells, stop after that many cells; the rest follows with the next flush()
+        lcd = self.lcd
+        frame = self.frame
+        glass = self.glass
+        num_columns = self.num_columns
+        # Glyphs are loaded before any cell is compared; LcdApi.custom_char() moves the cursor back to where
+        # the last move_to() put it, not to where the writes since then left it, so it is unknown afterwards
+        lcd_cursor = self.lcd_cursor
+        if self.glyphs.load(frame):
+            lcd_cursor = -1
+        table = self.glyphs.table
+        self.dirty = False
+        written = 0
+        for i in range(len(frame)):
+            b = table[frame[i]]
+            if b == glass[i]:
+                continue
+            if i != lcd_cursor:
+                lcd.move_to(i % num_columns, i // num_columns)
+            lcd.hal_write_data(b)
+            glass[i] = b
+            written += 1
+            lcd_cursor = i + 1
+            if lcd_cursor % num_columns == 0:
+                # The next line does not follow in DDRAM
+                lcd_cursor = -1
+            if written == max_cells:
+                self.dirty = True
+                break
+        self.lcd_cursor = lcd_cursor
+        if written and self.show is not None:
+            self.show()
+        return written
+
+
+if __name__ == "__main__":
+    # Compare the I2C traffic per preset change with the previous clear() and putstr() code path,
+    # with a stand-in for I2cLcd that produces the same traffic
+    from mock_i2c import CountingI2C, MockI2cLcd as I2cLcd
+
+    presets = [
+        ("ARP 2600", "Bloody Swing"),
+        ("ARP 2600", "Bloody Sweep"),
+        ("ARP 2600", "Brass Section"),
+        ("Jupiter-8", "Brass Section"),
+        ("Jupiter-8", "Bright Pad"),
+        ("Mini V", "Bright Pad 2"),
+    ]
+
+    i2c = CountingI2C()
+    lcd = I2cLcd(i2c, 0x27, 2, 16)
+    i2c.reset_counters()
+    for instrument, name in presets:
+        lcd.clear()
+        lcd.move_to(0, 0)
+        lcd.putstr(instrument)
+        lcd.move_to(0, 1)
+        lcd.putstr(name)
+    clear_bytes = i2c.bus_bytes / len(presets)
+
+    i2c = CountingI2C()
+    display = LcdFramebuffer(I2cLcd(i2c, 0x27, 2, 16), 2, 16)
+    i2c.reset_counters()
+    for instrument, name in presets:
+        display.clear()
+        display.move_to(0, 0)
+        display.putstr(instrument)
+        display.move_to(0, 1)
+        display.putstr(name)
+        display.flush()
+    diff_bytes = i2c.bus_bytes / len(presets)
+
+    print("clear() and putstr(): {:.0f} I2C bus bytes per preset change".format(clear_bytes))
+    print("framebuffer diff:     {:.0f} I2C bus bytes per preset change".format(diff_bytes))
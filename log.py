@@ -0,0 +1,129 @@
+# Leveled, rate-limited logging into a ring buffer, formatted later
+#
+# print() over USB CDC serial is slow and blocks when no host is reading, so calling it for every MIDI message,
+# encoder step or button press holds up the loop. Instead, record() stores the raw parts of a message (a constant
+# template, up to two arguments and optionally a copy of a few bytes) in preallocated slots, and flush() formats and
+# prints them later, when there is nothing else to do and someone is listening on the serial console.
+#
+# Level checks are cheap: call sites test the debug_on and info_on attributes before calling record(), e.g.
+#
+#     if log.debug_on:
+#         log.record(DEBUG, INPUT, "Button {} pressed", i)
+#
+# Each category is limited to rate_limit records per second; how many more there were is logged once the second
+# is over. Records that were overwritten before they could be printed are counted in dropped.
+
+from ticks import TICKS_PERIOD
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+# Categories
+SYSTEM = 0
+MIDI_IN = 1
+MIDI_OUT = 2
+INPUT = 3
+DISPLAY = 4
+CATEGORY_NAMES = ("system", "midi in", "midi out", "input", "display")
+
+
+class Log:
+    def __init__(self, ticks_ms, level=INFO, size=64, data_size=16, rate_limit=50):
+        self.ticks_ms = ticks_ms
+        self.set_level(level)
+        self.size = size
+        self.data_size = data_size
+        self.rate_limit = rate_limit
+        # Ring buffer of records; head is the next slot to write, count the number of records waiting
+        self.levels = bytearray(size)
+        self.categories = bytearray(size)
+        self.templates = [None] * size
+        self.first = [None] * size
+        self.second = [None] * size
+        self.data = bytearray(size * data_size)
+        self.data_lengths = bytearray(size)
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        # Start of the current one-second window and the number of records in it, per category
+        self.window_start = [0] * len(CATEGORY_NAMES)
+        self.window_count = [0] * len(CATEGORY_NAMES)
+        self.suppressed = [0] * len(CATEGORY_NAMES)
+
+    def set_level(self, level):
+        self.level = level
+        self.debug_on = level <= DEBUG
+        self.info_on = level <= INFO
+
+    def record(self, level, category, template, first=None, second=None, data=None, length=0):
+        # Store a record without formatting it; data[:length] is copied (up to data_size bytes) and shown as hex
+        if level < self.level:
+            return
+        if self.rate_limit:
+            now = self.ticks_ms()
+            # Unsigned, unlike ticks_diff(), so that a category that was quiet for days still gets a new window
+            if (now - self.window_start[category]) % TICKS_PERIOD >= 1000:
+                self.window_start[category] = now
+                self.window_count[category] = 0
+                suppressed = self.suppressed[category]
+                if suppressed:
+                    self.suppressed[category] = 0
+                    self._store(WARNING, category, "{} more messages were suppressed", suppressed, None, None, 0)
+            if self.window_count[category] >= self.rate_limit:
+                self.suppressed[category] += 1
+                return
+            self.window_count[category] += 1
+        self._store(level, category, template, first, second, data, length)
+
+    def _store(self, level, category, template, first, second, data, length):
+        slot = self.head
+        self.levels[slot] = level
+        self.categories[slot] = category
+        self.templates[slot] = template
+        self.first[slot] = first
+        self.second[slot] = second
+        if data is not None:
+            offset = slot * self.data_size
+            for i in range(min(length, self.data_size)):
+                self.data[offset + i] = data[i]
+        self.data_lengths[slot] = min(length, 255)
+        self.head = (slot + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+        else:
+            # The oldest record was overwritten
+            self.dropped += 1
+
+    def flush(self, max_records=0):
+        # Format and print the waiting records, oldest first; returns the number printed
+        printed = 0
+        while self.count:
+            slot = (self.head - self.count) % self.size
+            self.count -= 1
+            message = self.templates[slot].format(self.first[slot], self.second[slot])
+            length = self.data_lengths[slot]
+            if length:
+                offset = slot * self.data_size
+                message += " " + " ".join(["{:02X}".format(b) for b in self.data[offset:offset + min(length, self.data_size)]])
+                if length > self.data_size:
+                    message += " ..."
+            print(LEVEL_NAMES[self.levels[slot]], CATEGORY_NAMES[self.categories[slot]] + ":", message)
+            # Let go of the arguments
+            self.first[slot] = None
+            self.second[slot] = None
+            printed += 1
+            if printed == max_records:
+                break
+        if max_records == 0:
+            # Flushed on request; also tell about what is being suppressed in the current second
+            for category, suppressed in enumerate(self.suppressed):
+                if suppressed:
+                    print("WARNING", CATEGORY_NAMES[category] + ":", suppressed, "more messages were suppressed")
+                    self.suppressed[category] = 0
+        if self.count == 0 and self.dropped:
+            print("WARNING log:", self.dropped, "messages were dropped because the log was full")
+            self.dropped = 0
+        return printed
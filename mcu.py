@@ -0,0 +1,255 @@
+# Mackie Control Universal (MCU) engine
+#
+# Keeps what an MCU host (e.g. REAPER) sends for the control surface in a compact state store, and renders
+# part of it on the 2x16 character LCD. Messages are applied byte by byte from the framer's buffer, without
+# creating lists, strings or message objects, since hosts send meters and timecode many times per second.
+#
+# What is handled:
+# F0 00 00 66 14 12 pp tt... F7   LCD: text tt... at position pp of the 2x56 character display, 7 per strip
+# F0 00 00 66 14 00 F7            Device query; answered with the host connection query
+# F0 00 00 66 14 02 ss... rr... F7 Host connection reply; answered with the connection confirmation
+# F0 00 00 66 14 13 00 F7         Version request; answered with the version reply
+# B0 30...37 vv                   V-Pot LED ring of strips 1...8
+# B0 40...49 vv                   Timecode display, rightmost digit first; B0 4A...4B: assignment display
+# D0 sv                           Meter: s = strip, v = level 0...C, E = set clip, F = clear clip
+# E0...E7 ll mm                   Fader position of strips 1...8
+# 90 nn vv                        Button LEDs; the SELECT LEDs (notes 18...1F) choose which strips are shown
+#
+# The LCD shows two strips side by side, each 7 characters wide followed by its meter, with the upper row of
+# the MCU display on the first line and the lower row on the second. While the V-Pot ring of a strip is lit,
+# the last character of its upper row (usually the space after the name) shows the ring position instead.
+
+from charset import LCD_TEXT
+
+MCU_HEADER = b"\xF0\x00\x00\x66\x14"
+
+LCD = 0x12
+DEVICE_QUERY = 0x00
+HOST_CONNECTION_REPLY = 0x02
+VERSION_REQUEST = 0x13
+
+STRIPS = 8
+STRIP_WIDTH = 7
+LCD_WIDTH = STRIPS * STRIP_WIDTH
+TIMECODE_DIGITS = 10
+SELECT_NOTES = 0x18
+
+# What to show on the LCD
+VIEW_STRIPS = 0
+VIEW_TIMECODE = 1
+
+# Meters take two cells, one above the other, each showing half of the level 0...12; clipping is shown as "!"
+METER_CHARS = b" ..::||"
+METER_CLIP = ord("!")
+
+# V-Pot ring position 1...11 (the low 4 bits of the ring value; 0 is off), from fully left over 6 in the
+# center to fully right
+RING_CHARS = b" 123456789AB"
+
+# Serial number sent in the handshake
+SERIAL = b"MOCK001"
+
+
+class McuState:
+    # Everything the host has sent, in preallocated bytearrays
+    def __init__(self):
+        self.lcd = bytearray(b" " * (2 * LCD_WIDTH))
+        self.vpot = bytearray(STRIPS)
+        self.meter = bytearray(STRIPS)
+        self.clip = bytearray(STRIPS)
+        # 14 bit fader positions, LSB and MSB per strip
+        self.fader = bytearray(2 * STRIPS)
+        # Timecode and assignment display as characters, leftmost first; dots separately
+        self.timecode = bytearray(b" " * TIMECODE_DIGITS)
+        self.timecode_dots = bytearray(TIMECODE_DIGITS)
+        self.assignment = bytearray(b"  ")
+        self.leds = bytearray(128)
+
+
+def seven_segment_char(value):
+    # Characters of the timecode and assignment displays are 6 bit: 00...1F are @, A...Z..., 20...3F as in ASCII
+    value &= 0x3F
+    return value + 0x40 if value < 0x20 else value
+
+
+class McuEngine:
+    def __init__(self, display, midi_out):
+        self.display = display
+        self.midi_out = midi_out
+        self.state = McuState()
+        self.first_strip = 0
+        self.view = VIEW_STRIPS
+        # One bit per strip whose text, V-Pot or meter changed since the last render(), and whether the timecode did;
+        # nothing is drawn before the host sends something
+        self.dirty_strips = 0
+        self.dirty_timecode = False
+        # Preallocated replies
+        self.connection_query = bytearray(MCU_HEADER + b"\x01" + SERIAL + b"\x00\x00\x00\x00\xF7")
+        self.connection_confirmation = bytearray(MCU_HEADER + b"\x03" + SERIAL + b"\xF7")
+        self.version_reply = bytearray(MCU_HEADER + b"\x14" + b"1.00 " + b"\xF7")
+
+    def handle(self, msg, length):
+        # Apply one message to the state store; returns True if it was an MCU message handled here
+        status = msg[0]
+        if status == 0xF0:
+            return self._sysex(msg, length)
+        if length < 2:
+            return False
+        kind = status & 0xF0
+        if kind == 0xD0:
+            self._meter(msg[1])
+            return True
+        if kind == 0xE0 and length == 3:
+            strip = status & 0x0F
+            if strip < STRIPS:
+                self.state.fader[2 * strip] = msg[1]
+                self.state.fader[2 * strip + 1] = msg[2]
+            return True
+        if status == 0xB0 and length == 3:
+            control = msg[1]
+            if 0x30 <= control < 0x30 + STRIPS:
+                strip = control - 0x30
+                if self.state.vpot[strip] != msg[2]:
+                    self.state.vpot[strip] = msg[2]
+                    self.dirty_strips |= 1 << strip
+                return True
+            if 0x40 <= control < 0x40 + TIMECODE_DIGITS:
+                # CC 40 is the rightmost digit
+                i = TIMECODE_DIGITS - 1 - (control - 0x40)
+                self.state.timecode[i] = seven_segment_char(msg[2])
+                self.state.timecode_dots[i] = msg[2] & 0x40
+                self.dirty_timecode = True
+                return True
+            if control == 0x4A or control == 0x4B:
+                self.state.assignment[0x4B - control] = seven_segment_char(msg[2])
+                self.dirty_timecode = True
+                return True
+            return False
+        if status == 0x90 and length == 3:
+            note = msg[1]
+            self.state.leds[note] = msg[2]
+            if SELECT_NOTES <= note < SELECT_NOTES + STRIPS and msg[2]:
+                self.show_strips(note - SELECT_NOTES)
+            return True
+        return False
+
+    def _meter(self, value):
+        strip = value >> 4
+        if strip >= STRIPS:
+            return
+        level = value & 0x0F
+        state = self.state
+        if level == 0x0E:
+            state.clip[strip] = 1
+        elif level == 0x0F:
+            state.clip[strip] = 0
+        elif level <= 0x0C:
+            if state.meter[strip] == level:
+                return
+            state.meter[strip] = level
+        else:
+            return
+        self.dirty_strips |= 1 << strip
+
+    def _sysex(self, msg, length):
+        if length < 7:
+            return False
+        for i in range(len(MCU_HEADER)):
+            if msg[i] != MCU_HEADER[i]:
+                return False
+        command = msg[5]
+        if command == LCD:
+            self._lcd(msg, length)
+            return True
+        if command == DEVICE_QUERY:
+            self.midi_out.write(self.connection_query)
+            return True
+        if command == HOST_CONNECTION_REPLY:
+            self.midi_out.write(self.connection_confirmation)
+            return True
+        if command == VERSION_REQUEST:
+            self.midi_out.write(self.version_reply)
+            return True
+        return False
+
+    def _lcd(self, msg, length):
+        # F0 00 00 66 14 12 pp tt... F7
+        lcd = self.state.lcd
+        position = msg[6]
+        dirty = 0
+        for i in range(7, length - 1):
+            if position >= len(lcd):
+                break
+            b = msg[i]
+            if lcd[position] != b:
+                lcd[position] = b
+                dirty |= 1 << (position % LCD_WIDTH // STRIP_WIDTH)
+            position += 1
+        self.dirty_strips |= dirty
+
+    def show_strips(self, strip):
+        # Show the pair of strips that strip belongs to
+        first = strip & ~1
+        if first != self.first_strip or self.view != VIEW_STRIPS:
+            self.first_strip = first
+            self.view = VIEW_STRIPS
+            self.dirty_strips = (1 << STRIPS) - 1
+
+    def show_timecode(self):
+        self.view = VIEW_TIMECODE
+        self.dirty_timecode = True
+
+    @property
+    def dirty(self):
+        if self.view == VIEW_STRIPS:
+            return self.dirty_strips & (3 << self.first_strip) != 0
+        return self.dirty_timecode
+
+    def render(self):
+        # Draw only the strips shown that changed into the framebuffer
+        display = self.display
+        if self.view == VIEW_TIMECODE:
+            if self.dirty_timecode:
+                self._render_timecode()
+            return
+        state = self.state
+        for column in range(2):
+            strip = self.first_strip + column
+            if not self.dirty_strips & (1 << strip):
+                continue
+            x = column * (STRIP_WIDTH + 1)
+            for line in range(2):
+                display.move_to(x, line)
+                offset = line * LCD_WIDTH + strip * STRIP_WIDTH
+                for i in range(offset, offset + STRIP_WIDTH):
+                    display.write_byte(LCD_TEXT[state.lcd[i]])
+            position = state.vpot[strip] & 0x0F
+            if 0 < position < len(RING_CHARS):
+                display.move_to(x + STRIP_WIDTH - 1, 0)
+                display.write_byte(RING_CHARS[position])
+            # Meter in the column after the strip, from the bottom up over both lines
+            level = state.meter[strip]
+            display.move_to(x + STRIP_WIDTH, 0)
+            display.write_byte(METER_CLIP if state.clip[strip] else METER_CHARS[max(level - 6, 0)])
+            display.move_to(x + STRIP_WIDTH, 1)
+            display.write_byte(METER_CHARS[min(level, 6)])
+            self.dirty_strips &= ~(1 << strip)
+        display.dirty = True
+
+    def _render_timecode(self):
+        # Assignment and timecode on the first line, e.g. " 1 001.01.01.000", and nothing on the second
+        display = self.display
+        state = self.state
+        display.clear()
+        for b in state.assignment:
+            display.write_byte(b)
+        display.write_byte(0x20)
+        columns = 3
+        for i in range(TIMECODE_DIGITS):
+            display.write_byte(state.timecode[i])
+            columns += 1
+            if state.timecode_dots[i] and columns < display.num_columns:
+                display.write_byte(0x2E)
+                columns += 1
+        self.dirty_timecode = False
+        display.dirty = True
@@ -0,0 +1,124 @@
+# Minimal MIDI byte-stream framer, as a lightweight alternative to adafruit_midi for receiving
+#
+# Reads usb_midi.ports[0] directly into a reusable buffer and frames channel, system common,
+# realtime and sysex messages into another reusable buffer, without creating message objects.
+# receive() returns the length of the next complete message (0 if there is none yet), which
+# is then available in data[:length], a memoryview.
+#
+# Sysex messages go through SysexAssembler, which keeps them within the message buffer however long they are
+# (see sysex_assembler.py).
+
+from sysex_assembler import SysexAssembler
+from midi_trace import DIRECTION_IN
+
+# Number of data bytes that follow each channel message status, by high nibble
+_CHANNEL_DATA_BYTES = (2, 2, 2, 2, 1, 1, 2)  # 8x, 9x, Ax, Bx, Cx, Dx, Ex
+
+# Number of data bytes that follow each system common status F1...F6
+_SYSTEM_DATA_BYTES = (1, 2, 1, 0, 0, 0)
+
+
+class MidiFramer:
+    def __init__(self, port, read_size=64, message_size=192, field_size=32, filter_realtime=False):
+        self.port = port
+        self.read_buffer = bytearray(read_size)
+        self.read_pos = 0
+        self.read_len = 0
+        self.message = bytearray(message_size)
+        self.message_view = memoryview(self.message)
+        self.sysex = SysexAssembler(self.message, field_size)
+        self.realtime = bytearray(1)
+        self.realtime_view = memoryview(self.realtime)
+        # View of the buffer holding the last message returned by receive()
+        self.data = self.message_view
+        self.length = 0
+        # Data bytes still expected for the current channel or system common message
+        self.expected = 0
+        self.in_sysex = False
+        self.running_status = 0
+        # Discard realtime messages (clock, start, stop, active sensing...) instead of returning them
+        self.filter_realtime = filter_realtime
+        # TraceRecorder that gets every chunk read from the port, see midi_trace.py
+        self.trace = None
+
+    def _fill(self):
+        n = self.port.readinto(self.read_buffer)
+        if not n:
+            return False
+        self.read_pos = 0
+        self.read_len = n
+        if self.trace is not None:
+            self.trace.record(DIRECTION_IN, self.read_buffer, n)
+        return True
+
+    def receive(self):
+        read_buffer = self.read_buffer
+        message = self.message
+        while True:
+            if self.read_pos >= self.read_len and not self._fill():
+                return 0
+            b = read_buffer[self.read_pos]
+            self.read_pos += 1
+
+            if b >= 0xF8:
+                # Realtime messages may appear anywhere, even in the middle of other messages
+                if self.filter_realtime:
+                    continue
+                self.realtime[0] = b
+                self.data = self.realtime_view
+                return 1
+
+            if self.in_sysex:
+                if b < 0x80:
+                    self.sysex.feed(b)
+                    continue
+                self.in_sysex = False
+                if b == 0xF7:
+                    self.length = self.sysex.end()
+                    if self.length == 0:
+                        continue
+                    self.data = self.message_view
+                    return self.length
+                # Sysex aborted by another status byte, handle that byte as usual
+                self.sysex.abort()
+
+            if b == 0xF0:
+                self.sysex.start()
+                self.length = 0
+                self.in_sysex = True
+                self.running_status = 0
+                continue
+
+            if b >= 0x80:
+                message[0] = b
+                self.length = 1
+                if b >= 0xF0:
+                    # System common cancels running status
+                    self.running_status = 0
+                    self.expected = _SYSTEM_DATA_BYTES[b - 0xF1] if b < 0xF7 else 0
+                    if b == 0xF7:
+                        # Stray end of sysex
+                        self.length = 0
+                        continue
+                else:
+                    self.running_status = b
+                    self.expected = _CHANNEL_DATA_BYTES[(b >> 4) - 8]
+                if self.expected == 0:
+                    self.data = self.message_view
+                    return 1
+                continue
+
+            # Data byte
+            if self.expected == 0:
+                if self.running_status == 0:
+                    # Not part of any message
+                    continue
+                message[0] = self.running_status
+                self.length = 1
+                self.expected = _CHANNEL_DATA_BYTES[(self.running_status >> 4) - 8]
+            message[self.length] = b
+            self.length += 1
+            self.expected -= 1
+            if self.expected == 0:
+                self.data = self.message_view
+                return self.length
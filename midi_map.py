@@ -0,0 +1,155 @@
+# Declarative mapping from physical controls to the MIDI messages they send in each mode
+#
+# Each entry is (control, event, state, messages, menu):
+#   control  - which button or the rotary encoder
+#   event    - press/release for buttons, turn for the encoder
+#   state    - in which state the entry applies (in the menu or not, Shift held or not, or any)
+#   messages - the MIDI messages to send, in order
+#   menu     - ENTER_MENU or LEAVE_MENU to change the menu state (shown by the LED), or None
+#
+# compile_mode() turns the entries for one mode into a dict that maps an integer key to the
+# raw bytes to write to the MIDI port, so handling a physical event is one dict lookup and
+# one port write. For the encoder, the value of the last message is a placeholder that
+# encode_turn() fills in with the number of steps turned. Supporting a new mode (e.g. the KeyLab 61, which seems to have different
+# MIDI CC mappings than the KeyLab mkII 61) means adding a table here rather than code.
+
+# Controls
+BUTTON_CATEGORY = 0
+BUTTON_PRESET = 1
+BUTTON_PREVIOUS = 2
+BUTTON_NEXT = 3
+BUTTON_ENCODER = 4
+ENCODER = 5
+
+# Events
+PRESS = 0
+RELEASE = 1
+TURN = 2
+
+# Placeholders for the value of an encoder message, and how the number of steps is encoded
+RELATIVE_BINARY_OFFSET = 0x100  # 64 + steps, e.g. 65 for one step clockwise, 63 for one step counterclockwise
+RELATIVE_SIGNED_BIT = 0x101  # Mackie Control V-Pot: steps clockwise, or 0x40 + steps counterclockwise
+
+# State bits
+MENU = 1
+SHIFT = 2
+
+# State conditions as (mask, value)
+ANY = (0, 0)
+IN_MENU = (MENU, MENU)
+NOT_IN_MENU = (MENU, 0)
+SHIFTED = (SHIFT, SHIFT)
+NOT_SHIFTED = (SHIFT, 0)
+
+# Menu changes
+ENTER_MENU = True
+LEAVE_MENU = False
+
+
+def cc(control, value):
+    return (0xB0, control, value)
+
+
+def note_on(note, velocity):
+    return (0x90, note, velocity)
+
+
+def note_off(note, velocity=0x7F):
+    # Velocity 7F, which is what adafruit_midi's NoteOff sent by default
+    return (0x80, note, velocity)
+
+
+def relative(control, encoding=RELATIVE_BINARY_OFFSET):
+    return (0xB0, control, encoding)
+
+
+MAPPINGS = {
+    # Arturia mode, e.g., for AnalogLab
+    "arturia": (
+        (ENCODER, TURN, NOT_IN_MENU, (cc(114, 64), relative(114)), None),
+        (ENCODER, TURN, IN_MENU, (cc(112, 64), relative(112)), None),
+        # QUESTION: What should actually happen when we are already in the menu and press the "Category" button?
+        (BUTTON_CATEGORY, PRESS, NOT_IN_MENU, (cc(116, 127),), ENTER_MENU),
+        # QUESTION: According to https://www.youtube.com/watch?v=ipnTPsDN3t4 3:33, the "Preset" button
+        # may not always go into Preset mode, as it is also used to "select a song from the playlist"
+        (BUTTON_PRESET, PRESS, ANY, (cc(117, 127),), LEAVE_MENU),
+        (BUTTON_PREVIOUS, PRESS, ANY, (cc(28, 127),), None),
+        (BUTTON_NEXT, PRESS, ANY, (cc(29, 127),), None),
+        # NOTE: This also functions as "Like" when long-pressed; hence we also need to send value 0 as soon as the button is released
+        (BUTTON_ENCODER, PRESS, NOT_IN_MENU, (cc(115, 127),), None),
+        (BUTTON_ENCODER, PRESS, IN_MENU, (cc(113, 127),), None),
+        (BUTTON_CATEGORY, RELEASE, ANY, (cc(117, 0),), None),
+        (BUTTON_PRESET, RELEASE, ANY, (cc(28, 0),), None),
+        (BUTTON_PREVIOUS, RELEASE, ANY, (cc(29, 0),), None),
+        (BUTTON_NEXT, RELEASE, ANY, (cc(116, 0),), None),
+        (BUTTON_ENCODER, RELEASE, NOT_IN_MENU, (cc(115, 0),), None),
+        (BUTTON_ENCODER, RELEASE, IN_MENU, (cc(113, 0),), None),
+    ),
+    # DAW mode, e.g., for MiniDexed; button 0 is used as Shift
+    "daw": (
+        (ENCODER, TURN, ANY, (cc(28, 64), relative(28)), None),
+        (BUTTON_ENCODER, PRESS, NOT_SHIFTED, (cc(118, 127),), None),  # Click
+        (BUTTON_ENCODER, PRESS, SHIFTED, (cc(119, 127),), None),  # Shft + Click
+        # To end the "Click" and the "Shft + Click" action
+        (BUTTON_ENCODER, RELEASE, ANY, (cc(118, 0), cc(119, 0)), None),
+    ),
+    # Mackie Control Universal mode
+    # https://github.com/bitwig/bitwig-extensions/blob/da7d70e73cc055475d63ac6c7de17e69f89f4993/src/main/java/com/bitwig/extensions/controllers/arturia/keylab/essential/ArturiaKeylabEssentialControllerExtension.java
+    "mcu": (
+        # Jog wheel
+        (ENCODER, TURN, ANY, (relative(0x3C, RELATIVE_SIGNED_BIT),), None),
+        (BUTTON_CATEGORY, PRESS, ANY, (note_on(0x65, 127), note_off(0x65)), ENTER_MENU),  # L355
+        (BUTTON_PRESET, PRESS, ANY, (note_on(0x64, 127), note_off(0x64)), LEAVE_MENU),  # L366
+        (BUTTON_PREVIOUS, PRESS, ANY, (note_on(0x62, 127), note_off(0x62)), None),  # L323
+        (BUTTON_NEXT, PRESS, ANY, (note_on(0x63, 127),), None),  # L339
+        (BUTTON_ENCODER, PRESS, ANY, (note_on(0x54, 127),), None),  # "MIDI_NOTE_ON 0x54"
+        (BUTTON_CATEGORY, RELEASE, ANY, (cc(117, 0),), None),
+        (BUTTON_PRESET, RELEASE, ANY, (cc(28, 0),), None),
+        (BUTTON_PREVIOUS, RELEASE, ANY, (cc(29, 0),), None),
+        (BUTTON_NEXT, RELEASE, ANY, (cc(116, 0),), None),
+        (BUTTON_ENCODER, RELEASE, ANY, (note_off(0x54),), None),
+    ),
+}
+
+
+def action_key(control, event, state):
+    return control << 4 | event << 2 | state
+
+
+def encode_turn(encoding, steps):
+    # Value of a relative encoder message for the given number of steps, at most 63 either way
+    if steps > 63:
+        steps = 63
+    elif steps < -63:
+        steps = -63
+    if encoding == RELATIVE_SIGNED_BIT:
+        if steps < 0:
+            return 0x40 - steps
+        return steps
+    return 64 + steps
+
+
+def compile_mode(mode, channel=0):
+    # Returns {action_key: (raw bytes, menu change, encoding)} for all states each entry applies to
+    # For TURN actions the last byte is to be replaced with encode_turn(encoding, steps)
+    actions = {}
+    for control, event, (mask, value), messages, menu in MAPPINGS[mode]:
+        data = bytearray()
+        encoding = None
+        for status, data1, data2 in messages:
+            data.append(status | channel)
+            data.append(data1)
+            if data2 > 0x7F:
+                encoding = data2
+                data2 = encode_turn(encoding, 0)
+            data.append(data2)
+        if encoding is None:
+            data = bytes(data)
+        action = (data, menu, encoding)
+        for state in range((MENU | SHIFT) + 1):
+            if state & mask == value:
+                key = action_key(control, event, state)
+                if key in actions:
+                    raise ValueError("Overlapping mappings for control {} in mode {}".format(control, mode))
+                actions[key] = action
+    return actions
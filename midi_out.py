@@ -0,0 +1,74 @@
+# Coalescing MIDI output stage
+#
+# Most actions send pairs or bursts of messages, e.g. CC 114 64 followed by CC 114 65.
+# Instead of one USB write per message, raw bytes are appended to a preallocated buffer
+# that is written to the port with a single write() once per loop iteration.
+#
+# Optionally, running status is used: the status byte of a channel message is left out
+# if it is the same as that of the previous channel message in the same flush.
+
+from midi_trace import DIRECTION_OUT
+
+
+class MidiOut:
+    def __init__(self, port, size=64, running_status=False):
+        self.port = port
+        self.buffer = bytearray(size)
+        self.length = 0
+        self.running_status = running_status
+        self.last_status = 0
+        # Counters; without coalescing, every call to write() would have been a USB write of its own
+        self.messages = 0
+        self.writes = 0
+        self.bytes = 0
+        # TraceRecorder that gets every USB write, see midi_trace.py
+        self.trace = None
+
+    def write(self, data):
+        # Append one or more complete raw MIDI messages
+        self.messages += 1
+        if self.length + len(data) > len(self.buffer):
+            self.flush()
+            if len(data) > len(self.buffer):
+                # Too large to buffer (e.g. a long sysex), send it right away
+                self._write(data, len(data))
+                return
+        if not self.running_status:
+            self.buffer[self.length:self.length + len(data)] = data
+            self.length += len(data)
+            return
+        buffer = self.buffer
+        length = self.length
+        last_status = self.last_status
+        for b in data:
+            if b >= 0xF8:
+                # Realtime messages do not affect running status
+                pass
+            elif b >= 0xF0:
+                last_status = 0
+            elif b >= 0x80:
+                if b == last_status:
+                    continue
+                last_status = b
+            buffer[length] = b
+            length += 1
+        self.length = length
+        self.last_status = last_status
+
+    def flush(self):
+        # Write everything that was buffered with a single write; returns the number of bytes
+        length = self.length
+        if length == 0:
+            return 0
+        self._write(self.buffer, length)
+        self.length = 0
+        # Start every write with a full status byte
+        self.last_status = 0
+        return length
+
+    def _write(self, data, length):
+        self.port.write(data, length)
+        if self.trace is not None:
+            self.trace.record(DIRECTION_OUT, data, length)
+        self.writes += 1
+        self.bytes += length
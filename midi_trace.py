@@ -0,0 +1,109 @@
+# Recorder for the raw MIDI traffic, for working out protocols and for replaying it with replay.py
+#
+# Every chunk of bytes read from the MIDI in port and every USB write to the MIDI out port is recorded with the
+# time since the previous one into a preallocated ring buffer; when it is full, the oldest records are overwritten.
+# Recording copies bytes in a loop and uses supervisor.ticks_ms(), so it does not allocate or print anything.
+# save() writes the records to a file on demand (on the device, CIRCUITPY is writable by the firmware unless it is
+# exposed as a USB drive, see boot.py).
+#
+# File format: TRACE_MAGIC, followed by the records, oldest first:
+#   1 byte     direction (DIRECTION_IN or DIRECTION_OUT)
+#   2 bytes    ms since the previous record, big endian, saturated at 65535
+#   2 bytes    number of MIDI bytes n, big endian
+#   n bytes    MIDI bytes
+
+from ticks import TICKS_PERIOD
+
+TRACE_MAGIC = b"MTR1"
+
+DIRECTION_IN = 0
+DIRECTION_OUT = 1
+
+_HEADER_SIZE = 5
+
+
+class TraceRecorder:
+    def __init__(self, ticks_ms, size=16384):
+        self.ticks_ms = ticks_ms
+        self.buffer = bytearray(size)
+        # Oldest record starts at tail, the next one goes to head
+        self.head = 0
+        self.tail = 0
+        self.used = 0
+        self.last_ms = None
+        self.records = 0
+        self.overwritten = 0
+
+    def clear(self):
+        self.head = 0
+        self.tail = 0
+        self.used = 0
+        self.last_ms = None
+        self.records = 0
+        self.overwritten = 0
+
+    def record(self, direction, data, length):
+        buffer = self.buffer
+        size = len(buffer)
+        n = _HEADER_SIZE + length
+        if n > size:
+            return
+        # Make room by dropping the oldest records
+        while size - self.used < n:
+            tail = self.tail
+            dropped = _HEADER_SIZE + (buffer[(tail + 3) % size] << 8 | buffer[(tail + 4) % size])
+            self.tail = (tail + dropped) % size
+            self.used -= dropped
+            self.records -= 1
+            self.overwritten += 1
+
+        now = self.ticks_ms()
+        # Unsigned, unlike ticks_diff(), so that a gap of days saturates instead of going negative
+        delta = 0 if self.last_ms is None else (now - self.last_ms) % TICKS_PERIOD
+        if delta > 0xFFFF:
+            delta = 0xFFFF
+        self.last_ms = now
+
+        i = self.head
+        buffer[i] = direction
+        buffer[(i + 1) % size] = delta >> 8
+        buffer[(i + 2) % size] = delta & 0xFF
+        buffer[(i + 3) % size] = length >> 8
+        buffer[(i + 4) % size] = length & 0xFF
+        i = (i + _HEADER_SIZE) % size
+        for j in range(length):
+            buffer[i] = data[j]
+            i += 1
+            if i == size:
+                i = 0
+        self.head = i
+        self.used += n
+        self.records += 1
+
+    def save(self, path):
+        # Write the records to a file, oldest first; returns the number of records
+        view = memoryview(self.buffer)
+        with open(path, "wb") as f:
+            f.write(TRACE_MAGIC)
+            if self.used:
+                if self.tail < self.head:
+                    f.write(view[self.tail:self.head])
+                else:
+                    f.write(view[self.tail:])
+                    f.write(view[:self.head])
+        return self.records
+
+
+def read_trace(path):
+    # Returns a list of (direction, ms since the previous record, bytes)
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(TRACE_MAGIC)] != TRACE_MAGIC:
+        raise ValueError(path + " is not a MIDI trace")
+    records = []
+    i = len(TRACE_MAGIC)
+    while i + _HEADER_SIZE <= len(data):
+        length = data[i + 3] << 8 | data[i + 4]
+        records.append((data[i], data[i + 1] << 8 | data[i + 2], data[i + _HEADER_SIZE:i + _HEADER_SIZE + length]))
+        i += _HEADER_SIZE + length
+    return records
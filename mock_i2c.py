@@ -0,0 +1,124 @@
+# Stand-in for busio.I2C that counts the bus traffic instead of talking to hardware
+# This makes it possible to measure the cost of display updates on a Linux host
+
+
+class CountingI2C:
+    def __init__(self, addresses=(0x27,)):
+        self.addresses = list(addresses)
+        self.locked = False
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bytes_written = 0
+
+    @property
+    def bus_bytes(self):
+        # Every transaction also puts the address byte on the bus
+        return self.transactions + self.bytes_written
+
+    def try_lock(self):
+        if self.locked:
+            return False
+        self.locked = True
+        return True
+
+    def unlock(self):
+        self.locked = False
+
+    def scan(self):
+        return list(self.addresses)
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        if address not in self.addresses:
+            raise OSError(19)  # ENODEV, like busio.I2C when nothing acknowledges
+        if end is None:
+            end = len(buffer)
+        self.transactions += 1
+        self.bytes_written += end - start
+
+
+class MockI2cLcd:
+    # Stand-in for I2cLcd from https://github.com/dhylands/python_lcd with the same I2C traffic: every
+    # command or data byte goes to the PCF8574 as two nibbles, each written with E high and then E low,
+    # i.e. 4 transactions of 1 byte; LcdApi's clear() is 2 commands, move_to() 1 and custom_char() 1 + 8
+    # data writes + a move_to() back to the cursor
+
+    MASK_RS = 0x01
+    MASK_E = 0x04
+    SHIFT_BACKLIGHT = 3
+    SHIFT_DATA = 4
+
+    def __init__(self, i2c, address, num_lines, num_columns):
+        self.i2c = i2c
+        self.address = address
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.cursor_x = 0
+        self.cursor_y = 0
+        self._backlight = True
+        # Function set, display on, entry mode, as LcdApi and I2cLcd do at init
+        for command in (0x33, 0x32, 0x28, 0x0C, 0x06):
+            self.hal_write_command(command)
+        self.clear()
+
+    @property
+    def backlight(self):
+        return self._backlight
+
+    @backlight.setter
+    def backlight(self, on):
+        self._backlight = on
+        self.i2c.writeto(self.address, bytes((1 << self.SHIFT_BACKLIGHT if on else 0,)))
+
+    def _write(self, value, flags):
+        for nibble in (value >> 4, value & 0x0F):
+            byte = flags | (self._backlight << self.SHIFT_BACKLIGHT) | (nibble << self.SHIFT_DATA)
+            self.i2c.writeto(self.address, bytes((byte | self.MASK_E,)))
+            self.i2c.writeto(self.address, bytes((byte,)))
+
+    def hal_write_command(self, cmd):
+        self._write(cmd, 0)
+
+    def hal_write_data(self, data):
+        self._write(data, self.MASK_RS)
+
+    def clear(self):
+        self.hal_write_command(0x01)
+        self.hal_write_command(0x02)
+        self.cursor_x = 0
+        self.cursor_y = 0
+
+    def move_to(self, cursor_x, cursor_y):
+        self.cursor_x = cursor_x
+        self.cursor_y = cursor_y
+        address = cursor_x & 0x3F
+        if cursor_y & 1:
+            address += 0x40
+        if cursor_y & 2:
+            address += self.num_columns
+        self.hal_write_command(0x80 | address)
+
+    def putchar(self, char):
+        if char == "\n":
+            self.cursor_x = self.num_columns
+        else:
+            self.hal_write_data(ord(char))
+            self.cursor_x += 1
+        if self.cursor_x >= self.num_columns:
+            self.cursor_x = 0
+            self.cursor_y += 1
+            if self.cursor_y >= self.num_lines:
+                self.cursor_y = 0
+            self.move_to(self.cursor_x, self.cursor_y)
+
+    def putstr(self, string):
+        for char in string:
+            self.putchar(char)
+
+    def custom_char(self, location, charmap):
+        location &= 0x7
+        self.hal_write_command(0x40 | (location << 3))
+        for i in range(8):
+            self.hal_write_data(charmap[i])
+        self.move_to(self.cursor_x, self.cursor_y)
@@ -0,0 +1,321 @@
+# Graphical 128x64 OLED (SSD1306 or SH1106 over I2C) as a display for LcdFramebuffer
+#
+# OledLcd behaves like an HD44780 on I2cLcd: a grid of character cells (21x8 with a 5x8 font in 6x8 cells),
+# with the A00 character ROM for the codes charset.py produces and 8 CGRAM slots for the glyphs of glyphs.py.
+# So the drawing code and the framebuffer work unchanged, only with more lines to draw on.
+#
+# Characters are rendered into a 1 KB page buffer in the layout of the display RAM (one byte is 8 pixels of
+# a column, one page is a row of 8 pixels high, i.e. one line of text). A full frame over I2C is more than
+# 1 KB, so for every page only the range of columns that changed since the last show() is sent, each with a
+# single data write; LcdFramebuffer.flush() calls show() after writing the changed cells.
+
+# The display controller chips, as set in code.py
+SSD1306 = "SSD1306"
+SH1106 = "SH1106"
+
+# Addresses of these displays, depending on the SA0 pin
+OLED_ADDRESSES = (0x3C, 0x3D)
+
+WIDTH = 128
+HEIGHT = 64
+PAGES = HEIGHT // 8
+CELL_WIDTH = 6
+FONT_WIDTH = 5
+
+# The SH1106 has 132 columns of RAM, of which the middle 128 are shown
+SH1106_COLUMN_OFFSET = 2
+
+# Control bytes: the rest of the write is commands or data
+_COMMAND = 0x00
+_DATA = 0x40
+
+_INIT = {
+    SSD1306: (
+        0xAE,        # Display off
+        0xD5, 0x80,  # Clock divider
+        0xA8, 0x3F,  # Multiplex ratio 64
+        0xD3, 0x00,  # No display offset
+        0x40,        # Start line 0
+        0x8D, 0x14,  # Charge pump on
+        0x20, 0x00,  # Horizontal addressing mode
+        0xA1,        # Segment remap
+        0xC8,        # COM scan direction reversed
+        0xDA, 0x12,  # COM pins
+        0x81, 0xCF,  # Contrast
+        0xD9, 0xF1,  # Precharge period
+        0xDB, 0x40,  # VCOMH level
+        0xA4,        # Show the RAM contents
+        0xA6,        # Not inverted
+    ),
+    SH1106: (
+        0xAE,        # Display off
+        0xD5, 0x80,  # Clock divider
+        0xA8, 0x3F,  # Multiplex ratio 64
+        0xD3, 0x00,  # No display offset
+        0x40,        # Start line 0
+        0xAD, 0x8B,  # DC-DC converter on
+        0xA1,        # Segment remap
+        0xC8,        # COM scan direction reversed
+        0xDA, 0x12,  # COM pins
+        0x81, 0x80,  # Contrast
+        0xD9, 0x22,  # Precharge period
+        0xDB, 0x35,  # VCOMH level
+        0xA4,        # Show the RAM contents
+        0xA6,        # Not inverted
+    ),
+}
+
+# 5x8 font for 20...7F, 5 columns per character, least significant bit at the top, like the A00 ROM:
+# 5C is a yen sign, 7E and 7F are arrows
+FONT = bytes((
+    0x00, 0x00, 0x00, 0x00, 0x00,  0x00, 0x00, 0x5F, 0x00, 0x00,  0x00, 0x07, 0x00, 0x07, 0x00,  0x14, 0x7F, 0x14, 0x7F, 0x14,
+    0x24, 0x2A, 0x7F, 0x2A, 0x12,  0x23, 0x13, 0x08, 0x64, 0x62,  0x36, 0x49, 0x55, 0x22, 0x50,  0x00, 0x05, 0x03, 0x00, 0x00,
+    0x00, 0x1C, 0x22, 0x41, 0x00,  0x00, 0x41, 0x22, 0x1C, 0x00,  0x14, 0x08, 0x3E, 0x08, 0x14,  0x08, 0x08, 0x3E, 0x08, 0x08,
+    0x00, 0x50, 0x30, 0x00, 0x00,  0x08, 0x08, 0x08, 0x08, 0x08,  0x00, 0x60, 0x60, 0x00, 0x00,  0x20, 0x10, 0x08, 0x04, 0x02,
+    0x3E, 0x51, 0x49, 0x45, 0x3E,  0x00, 0x42, 0x7F, 0x40, 0x00,  0x42, 0x61, 0x51, 0x49, 0x46,  0x21, 0x41, 0x45, 0x4B, 0x31,
+    0x18, 0x14, 0x12, 0x7F, 0x10,  0x27, 0x45, 0x45, 0x45, 0x39,  0x3C, 0x4A, 0x49, 0x49, 0x30,  0x01, 0x71, 0x09, 0x05, 0x03,
+    0x36, 0x49, 0x49, 0x49, 0x36,  0x06, 0x49, 0x49, 0x29, 0x1E,  0x00, 0x36, 0x36, 0x00, 0x00,  0x00, 0x56, 0x36, 0x00, 0x00,
+    0x08, 0x14, 0x22, 0x41, 0x00,  0x14, 0x14, 0x14, 0x14, 0x14,  0x00, 0x41, 0x22, 0x14, 0x08,  0x02, 0x01, 0x51, 0x09, 0x06,
+    0x32, 0x49, 0x79, 0x41, 0x3E,  0x7E, 0x11, 0x11, 0x11, 0x7E,  0x7F, 0x49, 0x49, 0x49, 0x36,  0x3E, 0x41, 0x41, 0x41, 0x22,
+    0x7F, 0x41, 0x41, 0x22, 0x1C,  0x7F, 0x49, 0x49, 0x49, 0x41,  0x7F, 0x09, 0x09, 0x01, 0x01,  0x3E, 0x41, 0x41, 0x51, 0x32,
+    0x7F, 0x08, 0x08, 0x08, 0x7F,  0x00, 0x41, 0x7F, 0x41, 0x00,  0x20, 0x40, 0x41, 0x3F, 0x01,  0x7F, 0x08, 0x14, 0x22, 0x41,
+    0x7F, 0x40, 0x40, 0x40, 0x40,  0x7F, 0x02, 0x04, 0x02, 0x7F,  0x7F, 0x04, 0x08, 0x10, 0x7F,  0x3E, 0x41, 0x41, 0x41, 0x3E,
+    0x7F, 0x09, 0x09, 0x09, 0x06,  0x3E, 0x41, 0x51, 0x21, 0x5E,  0x7F, 0x09, 0x19, 0x29, 0x46,  0x46, 0x49, 0x49, 0x49, 0x31,
+    0x01, 0x01, 0x7F, 0x01, 0x01,  0x3F, 0x40, 0x40, 0x40, 0x3F,  0x1F, 0x20, 0x40, 0x20, 0x1F,  0x7F, 0x20, 0x18, 0x20, 0x7F,
+    0x63, 0x14, 0x08, 0x14, 0x63,  0x03, 0x04, 0x78, 0x04, 0x03,  0x61, 0x51, 0x49, 0x45, 0x43,  0x00, 0x7F, 0x41, 0x41, 0x00,
+    0x15, 0x16, 0x7C, 0x16, 0x15,  0x00, 0x41, 0x41, 0x7F, 0x00,  0x04, 0x02, 0x01, 0x02, 0x04,  0x40, 0x40, 0x40, 0x40, 0x40,
+    0x00, 0x01, 0x02, 0x04, 0x00,  0x20, 0x54, 0x54, 0x54, 0x78,  0x7F, 0x48, 0x44, 0x44, 0x38,  0x38, 0x44, 0x44, 0x44, 0x20,
+    0x38, 0x44, 0x44, 0x48, 0x7F,  0x38, 0x54, 0x54, 0x54, 0x18,  0x08, 0x7E, 0x09, 0x01, 0x02,  0x08, 0x14, 0x54, 0x54, 0x3C,
+    0x7F, 0x08, 0x04, 0x04, 0x78,  0x00, 0x44, 0x7D, 0x40, 0x00,  0x20, 0x40, 0x44, 0x3D, 0x00,  0x00, 0x7F, 0x10, 0x28, 0x44,
+    0x00, 0x41, 0x7F, 0x40, 0x00,  0x7C, 0x04, 0x18, 0x04, 0x78,  0x7C, 0x08, 0x04, 0x04, 0x78,  0x38, 0x44, 0x44, 0x44, 0x38,
+    0x7C, 0x14, 0x14, 0x14, 0x08,  0x08, 0x14, 0x14, 0x18, 0x7C,  0x7C, 0x08, 0x04, 0x04, 0x08,  0x48, 0x54, 0x54, 0x54, 0x20,
+    0x04, 0x3F, 0x44, 0x40, 0x20,  0x3C, 0x40, 0x40, 0x20, 0x7C,  0x1C, 0x20, 0x40, 0x20, 0x1C,  0x3C, 0x40, 0x30, 0x40, 0x3C,
+    0x44, 0x28, 0x10, 0x28, 0x44,  0x0C, 0x50, 0x50, 0x50, 0x3C,  0x44, 0x64, 0x54, 0x4C, 0x44,  0x00, 0x08, 0x36, 0x41, 0x00,
+    0x00, 0x00, 0x7F, 0x00, 0x00,  0x00, 0x41, 0x36, 0x08, 0x00,  0x08, 0x08, 0x2A, 0x1C, 0x08,  0x08, 0x1C, 0x2A, 0x08, 0x08,
+))
+
+# The characters above 7F of the A00 ROM that charset.py uses
+ROM_HIGH = {
+    0xA5: b"\x00\x00\x08\x00\x00",  # Middle dot
+    0xDF: b"\x00\x07\x05\x07\x00",  # Degree
+    0xE1: b"\x20\x55\x54\x55\x78",  # a umlaut
+    0xE2: b"\x7E\x01\x49\x49\x36",  # Sharp s
+    0xE4: b"\xFC\x20\x20\x10\x3C",  # Micro
+    0xEC: b"\x18\x24\x7E\x24\x00",  # Cent
+    0xEE: b"\x7C\x09\x04\x05\x78",  # n tilde
+    0xEF: b"\x38\x45\x44\x45\x38",  # o umlaut
+    0xF5: b"\x3C\x41\x40\x21\x7C",  # u umlaut
+    0xFD: b"\x08\x08\x2A\x08\x08",  # Division
+}
+
+
+class OledLcd:
+    def __init__(self, i2c, address=0x3C, chip=SSD1306):
+        self.i2c = i2c
+        self.address = address
+        self.chip = chip
+        self.num_lines = PAGES
+        self.num_columns = WIDTH // CELL_WIDTH
+        # Character code in each cell, and the cell the next character goes to
+        self.cells = bytearray(b" " * (self.num_lines * self.num_columns))
+        self.cursor = 0
+        # Custom characters as columns, FONT_WIDTH bytes per slot
+        self.cgram = bytearray(8 * FONT_WIDTH)
+        # One byte per column of each page, with a control byte in front for sending it
+        self.pages = bytearray(1 + PAGES * WIDTH)
+        self.pages[0] = _DATA
+        # Range of columns of each page that changed since the last show(); first > last if none
+        self.dirty_first = bytearray(b"\xFF" * PAGES)
+        self.dirty_last = bytearray(PAGES)
+        self.window = bytearray(8)
+        self.window[0] = _COMMAND
+        self._backlight = False
+        # What show() has sent so far, for comparing update strategies
+        self.writes = 0
+        self.data_bytes = 0
+        self._command(_INIT[chip])
+        self.clear()
+        self.show()
+        self.backlight = True
+
+    def _command(self, commands):
+        buffer = bytearray(1 + len(commands))
+        buffer[0] = _COMMAND
+        buffer[1:] = bytes(commands)
+        self.i2c.writeto(self.address, buffer)
+
+    @property
+    def backlight(self):
+        return self._backlight
+
+    @backlight.setter
+    def backlight(self, on):
+        # There is no backlight; this switches the whole display on or off
+        self._backlight = on
+        self._command((0xAF if on else 0xAE,))
+
+    def clear(self):
+        cells = self.cells
+        for i in range(len(cells)):
+            cells[i] = 0x20
+        pages = self.pages
+        for i in range(1, len(pages)):
+            pages[i] = 0
+        for page in range(PAGES):
+            self.dirty_first[page] = 0
+            self.dirty_last[page] = WIDTH - 1
+        self.cursor = 0
+
+    def move_to(self, cursor_x, cursor_y):
+        self.cursor = cursor_y * self.num_columns + cursor_x
+
+    def hal_write_data(self, data):
+        if self.cursor >= len(self.cells):
+            self.cursor = 0
+        self.cells[self.cursor] = data
+        self._render(self.cursor)
+        self.cursor += 1
+
+    def custom_char(self, location, charmap):
+        # Turn the rows of the HD44780 character into columns, and redraw the cells that show it
+        location &= 0x7
+        offset = location * FONT_WIDTH
+        for x in range(FONT_WIDTH):
+            column = 0
+            for y in range(8):
+                if charmap[y] & (0x10 >> x):
+                    column |= 1 << y
+            self.cgram[offset + x] = column
+        cells = self.cells
+        for i in range(len(cells)):
+            if cells[i] < 0x10 and cells[i] & 0x7 == location:
+                self._render(i)
+
+    def _render(self, cell):
+        # Draw the character in cell into the page buffer, and mark the columns that changed
+        code = self.cells[cell]
+        if code < 0x10:
+            font = self.cgram
+            offset = (code & 0x7) * FONT_WIDTH
+        elif 0x20 <= code < 0x80:
+            font = FONT
+            offset = (code - 0x20) * FONT_WIDTH
+        elif code in ROM_HIGH:
+            font = ROM_HIGH[code]
+            offset = 0
+        else:
+            font = None
+            offset = 0
+        page = cell // self.num_columns
+        x = (cell % self.num_columns) * CELL_WIDTH
+        pages = self.pages
+        i = 1 + page * WIDTH + x
+        first = -1
+        last = -1
+        for column in range(CELL_WIDTH):
+            b = font[offset + column] if font is not None and column < FONT_WIDTH else 0
+            if pages[i + column] != b:
+                pages[i + column] = b
+                if first < 0:
+                    first = x + column
+                last = x + column
+        if first >= 0:
+            if first < self.dirty_first[page]:
+                self.dirty_first[page] = first
+            if last > self.dirty_last[page]:
+                self.dirty_last[page] = last
+
+    def show(self):
+        # Send the changed columns of each page, with one window command and one data write per page;
+        # returns the number of data bytes sent
+        i2c = self.i2c
+        address = self.address
+        pages = self.pages
+        window = self.window
+        sent = 0
+        for page in range(PAGES):
+            first = self.dirty_first[page]
+            last = self.dirty_last[page]
+            if first > last:
+                continue
+            if self.chip == SH1106:
+                column = first + SH1106_COLUMN_OFFSET
+                window[1] = 0xB0 | page
+                window[2] = column & 0x0F
+                window[3] = 0x10 | column >> 4
+                i2c.writeto(address, window, end=4)
+            else:
+                window[1] = 0x21
+                window[2] = first
+                window[3] = last
+                window[4] = 0x22
+                window[5] = page
+                window[6] = page
+                i2c.writeto(address, window, end=7)
+            # The data goes out straight from the page buffer, behind a control byte in front of it
+            start = page * WIDTH + first
+            saved = pages[start]
+            pages[start] = _DATA
+            i2c.writeto(address, pages, start=start, end=1 + page * WIDTH + last + 1)
+            pages[start] = saved
+            sent += last - first + 1
+            self.writes += 2
+            self.dirty_first[page] = 0xFF
+            self.dirty_last[page] = 0
+        self.data_bytes += sent
+        return sent
+
+
+if __name__ == "__main__":
+    # Compare the I2C traffic of sending the whole frame with sending only what changed, per preset change
+    from mock_i2c import CountingI2C
+    from host_hal import set_text_sysex
+    from lcd_framebuffer import LcdFramebuffer
+    from charset import FieldText, LCD_TEXT, LCD_TEXT_HEART
+    from arturia_sysex import new_fields, parse_set_text, has_heart
+
+    presets = [
+        ("ARP 2600", "*Bloody Swing", "Noise", True),
+        ("ARP 2600", "*Bloody Sweep", "Noise", True),
+        ("ARP 2600", "Brass Section", "Brass", False),
+        ("Jupiter-8", "Brass Section", "Brass", False),
+        ("Jupiter-8", "Bright Pad", "Pad", False),
+        ("Mini V", "Bright Pad 2", "Pad", False),
+    ]
+
+    def draw(display, message, fields, text):
+        # What the controller does with a set text sysex, with the type on the third line
+        parse_set_text(message, fields)
+        table = LCD_TEXT_HEART if has_heart(message, fields) else LCD_TEXT
+        display.clear()
+        for line in range(3):
+            start = fields[2 * line]
+            if start >= 0:
+                text.translate(message, start, fields[2 * line + 1], table if line == 1 else LCD_TEXT)
+                display.move_to(0, line)
+                for i in range(text.length):
+                    display.write_byte(text.buffer[i])
+        display.dirty = True
+
+    for chip in (SSD1306, SH1106):
+        i2c = CountingI2C((0x3C,))
+        oled = OledLcd(i2c, 0x3C, chip)
+        display = LcdFramebuffer(oled, oled.num_lines, oled.num_columns)
+        fields = new_fields()
+        text = FieldText()
+        full = 0
+        partial = 0
+        for instrument, preset, kind, heart in presets:
+            draw(display, set_text_sysex(instrument, preset, kind, heart), fields, text)
+            i2c.reset_counters()
+            display.flush()
+            partial += i2c.bus_bytes
+            # The whole frame, as a plain framebuffer driver would send it
+            i2c.reset_counters()
+            for page in range(PAGES):
+                oled.dirty_first[page] = 0
+                oled.dirty_last[page] = WIDTH - 1
+            oled.show()
+            full += i2c.bus_bytes
+        print("{}: {:.0f} I2C bus bytes per preset change for the whole frame, {:.0f} for the changed regions".format(
+            chip, full / len(presets), partial / len(presets)))
@@ -0,0 +1,65 @@
+# Mirror of the parameter values that the host writes with the Arturia "write value" sysex
+#
+# 01 - Read value:  F0 00 20 6B 7F 42 01 00 pp bb F7
+# 02 - Write value: F0 00 20 6B 7F 42 02 00 pp bb vv F7
+# pp = parameter number, bb = button id, vv = value
+#
+# Values are kept in a fixed-size open addressing hash table in bytearrays, so writing and reading a value
+# takes constant time and does not allocate. A read value is answered right away with a write value message
+# carrying the value, built into a reusable buffer, so the host gets its answer in one round trip.
+
+from arturia_sysex import ARTURIA_HEADER
+
+READ_VALUE = 0x01
+WRITE_VALUE = 0x02
+
+# Marks a free slot; parameter numbers are 7 bit, so this is never a valid key
+_FREE = 0xFF
+
+
+class ParameterTable:
+    def __init__(self, size=128):
+        # size must be a power of two
+        self.mask = size - 1
+        self.keys = bytearray(b"\xFF" * (2 * size))
+        self.values = bytearray(size)
+        self.count = 0
+        # Writes that did not fit because the table was full
+        self.overflows = 0
+        self.reply = bytearray(ARTURIA_HEADER + b"\x02\x00\x00\x00\x00\xF7")
+
+    def _slot(self, pp, bb):
+        # Slot holding (pp, bb), or the free slot where it would go, or -1 if the table is full
+        keys = self.keys
+        slot = (pp * 31 + bb) & self.mask
+        for _ in range(self.mask + 1):
+            key = keys[2 * slot]
+            if key == _FREE or (key == pp and keys[2 * slot + 1] == bb):
+                return slot
+            slot = (slot + 1) & self.mask
+        return -1
+
+    def set(self, pp, bb, value):
+        slot = self._slot(pp, bb)
+        if slot < 0:
+            self.overflows += 1
+            return
+        if self.keys[2 * slot] == _FREE:
+            self.keys[2 * slot] = pp
+            self.keys[2 * slot + 1] = bb
+            self.count += 1
+        self.values[slot] = value
+
+    def get(self, pp, bb, default=0):
+        slot = self._slot(pp, bb)
+        if slot < 0 or self.keys[2 * slot] == _FREE:
+            return default
+        return self.values[slot]
+
+    def read_reply(self, pp, bb):
+        # Answer to a read value request: a write value message with the mirrored value (0 if never written)
+        reply = self.reply
+        reply[8] = pp
+        reply[9] = bb
+        reply[10] = self.get(pp, bb)
+        return reply
@@ -0,0 +1,234 @@
+# Hardware of the Raspberry Pi Pico, for use by controller.py
+"""
+RPi Pico      <-> Peripherals
+Pin 1  (GP0)  <-> Display SDA
+Pin 2  (GP1)  <-> Display SCL
+Pin 3  (GND)  <-> Display GND
+Pin 4  (GP2)  <-> Button 0: Category
+Pin 5  (GP3)  <-> Button 1: Preset
+Pin 6  (GP4)  <-> Button 2: <-
+Pin 7  (GP5)  <-> Button 3: ->
+Pin 8  (GND)  <-> Button GND
+Pin 9  (GP6)  <-> Rotary Encoder CLK
+Pin 10 (GP7)  <-> Rotary Encoder DT
+Pin 11 (GP8)  <-> Rotary Encoder SW
+Pin 12 (GP9)  <-> Rotary Encoder +
+Pin 13 (GND)  <-> Rotary Encoder GND
+Pin 40 (VBUS) <-> Display VCC
+"""
+
+import board
+import rotaryio
+import busio
+import usb_midi
+import digitalio
+import keypad
+import time
+import gc
+import sys
+import supervisor
+
+from circuitpython_i2c_lcd import I2cLcd # https://github.com/dhylands/python_lcd
+from polled_keys import PolledKeys, PolledEvent
+
+BUTTON_PINS = (board.GP2, board.GP3, board.GP4, board.GP5, board.GP8)
+
+# Interval at which the buttons are scanned in the background; this also debounces them
+debounce_time = 0.02  # 20 ms debounce time
+
+# Addresses of PCF8574 and PCF8574A backpacks with the address jumpers open, which are tried before a full scan
+LCD_ADDRESSES = (0x27, 0x3F)
+# Ranges of addresses that a PCF8574 (20...27) or PCF8574A (38...3F) can have
+PCF8574_ADDRESSES = range(0x20, 0x28)
+PCF8574A_ADDRESSES = range(0x38, 0x40)
+
+# The PCF8574 is specified for 100 kHz, but most backpacks work at 400 kHz, which makes every LCD write faster
+I2C_STANDARD = 100000
+I2C_FAST = 400000
+
+
+def answers(i2c, address):
+    # Whether a device acknowledges its address, probed the same way as adafruit_bus_device does
+    try:
+        i2c.writeto(address, b"")
+        return True
+    except OSError:
+        pass
+    try:
+        i2c.readfrom_into(address, bytearray(1))
+        return True
+    except OSError:
+        return False
+
+
+def echoes(i2c, address, value=0x08):
+    # Whether the PCF8574 reads back what was written to it (backlight on, everything else low),
+    # i.e. whether it works at the current bus frequency
+    buffer = bytearray(1)
+    try:
+        i2c.writeto(address, bytes((value,)))
+        i2c.readfrom_into(address, buffer)
+    except OSError:
+        return False
+    return buffer[0] == value
+
+
+def find_display(i2c, saved_address):
+    # The address of the display: where it was last time, at the usual addresses, or else the first
+    # PCF8574 that a scan of the whole bus finds; None if there is none
+    for address in (saved_address,) + LCD_ADDRESSES:
+        if address is not None and answers(i2c, address):
+            return address
+    devices = i2c.scan()
+    print("I2C devices found:", [hex(device) for device in devices])
+    for device in devices:
+        if device in PCF8574_ADDRESSES or device in PCF8574A_ADDRESSES:
+            return device
+    return None
+
+
+class NullLcd:
+    # Stands in for I2cLcd when there is no display, so that everything else runs unchanged
+    def __init__(self, num_lines=2, num_columns=16):
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.backlight = False
+
+    def clear(self):
+        pass
+
+    def move_to(self, cursor_x, cursor_y):
+        pass
+
+    def hal_write_data(self, data):
+        pass
+
+    def custom_char(self, location, charmap):
+        pass
+
+
+class PicoHal:
+    def __init__(self, settings=None, oled=None, polled_buttons=False):
+        # How long setting up each part takes, reported when the controller is ready
+        self.boot_times = []
+        start_ns = time.monotonic_ns()
+
+        # Built-in LED
+        self.led = digitalio.DigitalInOut(board.LED)
+        self.led.direction = digitalio.Direction.OUTPUT
+        self.led.value = False
+
+        # Enable pull-up resistors for the buttons and check which ones are held down at power-on
+        # Note the buttons are active low
+        buttons = [digitalio.DigitalInOut(pin) for pin in BUTTON_PINS]
+        for button in buttons:
+            button.switch_to_input(pull=digitalio.Pull.UP)
+        self.held_at_startup = [not button.value for button in buttons]
+
+        if polled_buttons:
+            # The way it was done before keypad, only for comparing the loop latency (see polled_keys.py)
+            self.keys = PolledKeys(buttons)
+            self.key_event = PolledEvent()
+        else:
+            # From now on the buttons are scanned and debounced in the background by keypad,
+            # which puts timestamped press and release events into a queue
+            for button in buttons:
+                button.deinit()
+            self.keys = keypad.Keys(BUTTON_PINS, value_when_pressed=False, pull=True, interval=debounce_time)
+            self.key_event = keypad.Event()
+
+        # Set up rotary encoder
+        self.encoder = rotaryio.IncrementalEncoder(board.GP6, board.GP7)
+        # Switch on + pin of rotary encoder
+        self.switch = digitalio.DigitalInOut(board.GP9)
+        self.switch.switch_to_input(pull=digitalio.Pull.UP)
+
+        self.boot_times.append(("buttons and encoder", (time.monotonic_ns() - start_ns) // 1000000))
+        start_ns = time.monotonic_ns()
+        if oled is not None:
+            self.init_oled(settings, oled)
+        else:
+            self.init_display(settings)
+        self.boot_times.append(("display", (time.monotonic_ns() - start_ns) // 1000000))
+
+        # Print the available ports
+        print("Available MIDI ports:", usb_midi.ports)
+        # CircuitPython has a single USB MIDI cable, i.e. one input and one output port, see boot.py
+        self.midi_in_port = usb_midi.ports[0]
+        self.midi_out_port = usb_midi.ports[1]
+
+        self.monotonic_ns = time.monotonic_ns
+        self.mem_free = gc.mem_free
+        self.ticks_ms = supervisor.ticks_ms
+        self.gc_collect = gc.collect
+
+    def init_display(self, settings):
+        # Look for the display at 100 kHz, then switch to 400 kHz if it still works there
+        # Without a display, everything else still works (headless)
+        self.i2c = None
+        self.lcd = NullLcd()
+        saved_address = settings.display_address if settings is not None else None
+        i2c = self.lock_i2c(I2C_STANDARD)
+        address = find_display(i2c, saved_address)
+        if address is not None:
+            i2c.unlock()
+            i2c.deinit()
+            i2c = self.lock_i2c(I2C_FAST)
+            if not echoes(i2c, address):
+                i2c.unlock()
+                i2c.deinit()
+                i2c = self.lock_i2c(I2C_STANDARD)
+                print("Display at", hex(address), "does not work at 400 kHz, using 100 kHz")
+            try:
+                self.lcd = I2cLcd(i2c, address, 2, 16)
+                self.lcd.backlight = True
+            except OSError:
+                self.lcd = NullLcd()
+                address = None
+        self.i2c = i2c
+        if address is None:
+            print("No display found, running without one")
+        elif settings is not None:
+            # Written to nvm only if it changed
+            settings.display_address = address
+            settings.save()
+
+    def init_oled(self, settings, chip):
+        # The SSD1306 and SH1106 are specified for 400 kHz; their addresses are in the PCF8574A range,
+        # so they are only looked for when configured (see code.py)
+        # Imported here, so that the font is only loaded into RAM with an OLED
+        from oled import OledLcd, OLED_ADDRESSES
+        self.lcd = NullLcd()
+        saved_address = settings.display_address if settings is not None else None
+        i2c = self.lock_i2c(I2C_FAST)
+        address = None
+        for candidate in (saved_address,) + OLED_ADDRESSES:
+            if candidate in OLED_ADDRESSES and answers(i2c, candidate):
+                address = candidate
+                break
+        if address is not None:
+            try:
+                self.lcd = OledLcd(i2c, address, chip)
+            except OSError:
+                self.lcd = NullLcd()
+                address = None
+        self.i2c = i2c
+        if address is None:
+            print("No OLED display found, running without one")
+        elif settings is not None:
+            settings.display_address = address
+            settings.save()
+
+    def lock_i2c(self, frequency):
+        i2c = busio.I2C(board.GP1, board.GP0, frequency=frequency)
+        while not i2c.try_lock():
+            pass
+        return i2c
+
+    def serial_connected(self):
+        return supervisor.runtime.serial_connected
+
+    def serial_read(self):
+        if supervisor.runtime.serial_bytes_available:
+            return sys.stdin.read(1)
+        return None
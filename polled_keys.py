@@ -0,0 +1,96 @@
+# The buttons read the way code.py did before keypad.Keys, for measuring the difference
+#
+# Each pass through the loop reads every pin, and on every press and every release sleeps for the debounce
+# time before acting on it, during which nothing else (encoder, MIDI, display) is serviced. PolledKeys has
+# the interface of keypad.Keys, so the controller runs unchanged; set polled_buttons = True in code.py and
+# compare the worst-case loop latency, which is logged whenever it grows and shown by the "latency" console
+# command, with what keypad.Keys gives.
+#
+# python3 polled_keys.py compares both on a Linux host, with the fakes from host_hal.py.
+
+import time
+
+# What the old code slept for on every edge
+DEBOUNCE_TIME = 0.05
+
+
+class PolledEvent:
+    # Like keypad.Event, whose attributes cannot be set from Python
+    def __init__(self):
+        self.key_number = 0
+        self.pressed = False
+        self.released = True
+        self.timestamp = 0
+
+
+class PolledKeys:
+    def __init__(self, pins, debounce_time=DEBOUNCE_TIME):
+        # pins are digitalio.DigitalInOut with pull-ups, i.e. False while the button is held down
+        self.pins = pins
+        self.debounce_time = debounce_time
+        self.held = [False] * len(pins)
+        # keypad.Keys has its events in an EventQueue; here the pins are read when an event is asked for
+        self.events = self
+
+    def get_into(self, event):
+        # Fill event with the next press or release, debounced by sleeping; False if there is none
+        for i, pin in enumerate(self.pins):
+            if not pin.value and not self.held[i]:
+                time.sleep(self.debounce_time)
+                self.held[i] = True
+            elif pin.value and self.held[i]:
+                time.sleep(self.debounce_time)
+                if not pin.value:
+                    continue
+                self.held[i] = False
+            else:
+                continue
+            event.key_number = i
+            event.pressed = self.held[i]
+            event.released = not self.held[i]
+            event.timestamp = time.monotonic_ns() // 1000000
+            return True
+        return False
+
+
+if __name__ == "__main__":
+    # Click the buttons while the encoder is turned, and compare the worst-case loop latency
+    import contextlib
+    import io
+
+    from controller import Controller
+    from host_hal import HostHal
+    from profiles import PROFILES
+
+    CLICKS = 10
+
+    class FakePin:
+        def __init__(self):
+            self.value = True
+
+    def worst_latency(polled):
+        hal = HostHal()
+        pins = [FakePin() for _ in range(5)]
+        if polled:
+            hal.keys = PolledKeys(pins)
+            hal.key_event = PolledEvent()
+        with contextlib.redirect_stdout(io.StringIO()):
+            controller = Controller(hal, PROFILES["keylab_essential_61"])
+            controller.start()
+        for i in range(CLICKS):
+            button = 1 + i % 3
+            for pressed in (True, False):
+                if polled:
+                    pins[button].value = not pressed
+                elif pressed:
+                    hal.keys.press(button)
+                else:
+                    hal.keys.release(button)
+                for _ in range(5):
+                    hal.encoder.turn(1)
+                    controller.step()
+        return controller.worst_loop_ms
+
+    print("Worst-case loop latency with {} button clicks:".format(CLICKS))
+    print("  polled, sleeping {:.0f} ms per edge: {} ms".format(DEBOUNCE_TIME * 1000, worst_latency(True)))
+    print("  keypad.Keys:                    {} ms".format(worst_latency(False)))
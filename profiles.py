@@ -0,0 +1,65 @@
+# Registry of the Arturia devices that can be emulated
+#
+# boot.py uses this to set up the USB identification and MIDI port names,
+# code.py uses it to answer the Universal Device Inquiry and to parse the set text sysex.
+# Adding a new model means adding one entry to PROFILES.
+
+from collections import namedtuple
+
+from arturia_sysex import SET_TEXT_KEYLAB, SET_TEXT_MINILAB3
+
+ARTURIA_VID = 0x1C75
+
+# "Universal Device Request" message
+IDENTITY_REQUEST = b"\xF0\x7E\x7F\x06\x01\xF7"
+
+# Firmware version reported in the identity reply; how exactly to convert from XX.YY.ZZZZ to 0xXX 0xYY 0xZZ 0xZZ?
+FIRMWARE_VERSION = b"\x01\x01\x01\x01"
+
+Profile = namedtuple("Profile", (
+    "vid",              # USB vendor ID
+    "pid",              # USB product ID, None if unknown
+    "manufacturer",     # USB manufacturer string
+    "product",          # USB product string
+    "port_name",        # MIDI interface name (that shows up in AnalogLab)
+    "model",            # Family and model bytes of the identity reply, None if unknown
+    "set_text_layout",  # Layout of the set text sysex the host sends to this device
+    "identity_reply",   # Prebuilt reply to IDENTITY_REQUEST, None if unknown
+    "cables",           # Names of the USB MIDI cables of the real device, in USB order
+))
+
+
+def identity_reply(model):
+    # The Keylab Essential 61 responds with F0 7E 7F 06 02 00 20 6B 02 00 05 54 AA BB CC DD F7 (AA BB CC DD is the firmware version)
+    # https://docs.rs/midi-control/latest/midi_control/vendor/arturia/index.html
+    return b"\xF0\x7E\x7F\x06\x02\x00\x20\x6B\x02\x00" + bytes(model) + FIRMWARE_VERSION + b"\xF7"
+
+
+def arturia_profile(pid, product, port_name, model, set_text_layout=SET_TEXT_KEYLAB, manufacturer="Arturia", cables=None):
+    reply = identity_reply(model) if model is not None else None
+    if cables is None:
+        cables = (port_name,)
+    return Profile(ARTURIA_VID, pid, manufacturer, product, port_name, model, set_text_layout, reply, cables)
+
+
+# According to https://www.youtube.com/watch?v=ipnTPsDN3t4, the MIDI port is called "Keylab mkII 61 MIDI"
+# NOTE: "Arturia KeyLab Essential 61 MID" does NOT work with AnalogLab standalone!
+PROFILES = {
+    "keylab_essential_61": arturia_profile(0x028A, "Arturia KeyLab Essential 61", "Arturia KeyLab Essential 61", (0x05, 0x54)),  # Works
+    "keylab_mkii_61": arturia_profile(0x028B, "KeyLab mkII 61", "KeyLab mkII 61 MIDI", (0x05, 0x64)),  # Works
+    # Works but seems to have DIFFERENT MIDI CC mappings than the KeyLab mkII 61; identity reply unknown
+    "keylab_61": arturia_profile(0x0285, "KeyLab 61", "KeyLab 61", None),
+    # NOTE: lower-case "l" in "Minilab"! "Minilab3 MIDI" is confirmed from https://youtu.be/Zcwdv4ZYipw?feature=shared&t=529
+    # and the USB descriptor name form https://linux-hardware.org/?device_vendor=Arturia&device_type=sound
+    # NOTE: Minilab 3 has 3(!) MIDI cables: "Minilab3 MIDI", "Minilab3 DIN THRU", "Minilab3 MCU"
+    "minilab3": arturia_profile(0x220B, "Minilab3", "Minilab3 MIDI", (0x04, 0x04), SET_TEXT_MINILAB3,
+                                cables=("Minilab3 MIDI", "Minilab3 DIN THRU", "Minilab3 MCU")),
+    # FIXME: The USB product IDs and strings of these are unknown, only their identity replies are
+    "keylab_essential_49": arturia_profile(None, "Arturia KeyLab Essential 49", "Arturia KeyLab Essential 49", (0x05, 0x52)),
+    "keylab_essential_88": arturia_profile(None, "Arturia KeyLab Essential 88", "Arturia KeyLab Essential 88", (0x05, 0x58)),
+    "keylab_mkii_49": arturia_profile(None, "KeyLab mkII 49", "KeyLab mkII 49 MIDI", (0x05, 0x62)),
+    "keylab_mkii_88": arturia_profile(None, "KeyLab mkII 88", "KeyLab mkII 88 MIDI", (0x05, 0x68)),
+    "keylab_essential_49_mk3": arturia_profile(None, "Arturia KeyLab Essential 49 mk3", "Arturia KeyLab Essential 49 mk3", (0x05, 0x72)),
+    "keylab_essential_61_mk3": arturia_profile(None, "Arturia KeyLab Essential 61 mk3", "Arturia KeyLab Essential 61 mk3", (0x05, 0x74)),
+    "keylab_essential_88_mk3": arturia_profile(None, "Arturia KeyLab Essential 88 mk3", "Arturia KeyLab Essential 88 mk3", (0x05, 0x78)),
+}
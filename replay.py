@@ -0,0 +1,112 @@
+# Replays a MIDI trace recorded with trace_on = True (see midi_trace.py) through the controller logic on a
+# Linux host, with the fakes from host_hal.py, to see what it does with real traffic and how fast
+#
+# python3 replay.py trace.bin                  # As fast as possible, to benchmark throughput
+# python3 replay.py trace.bin --speed recorded # With the recorded timing
+# python3 replay.py trace.bin --profile        # ... under cProfile
+# python3 replay.py trace.bin --tracemalloc    # ... and show where memory is allocated after the first pass
+
+import argparse
+import contextlib
+import io
+import time
+
+from controller import Controller
+from host_hal import HostHal
+from midi_trace import read_trace, DIRECTION_IN, DIRECTION_OUT
+from profiles import PROFILES
+
+
+def replay(hal, controller, records, recorded_speed):
+    # Feed the incoming records to the controller; returns the number of loop iterations
+    steps = 0
+    for direction, delta_ms, data in records:
+        if direction != DIRECTION_IN:
+            continue
+        if recorded_speed and delta_ms:
+            # Keep the loop running while waiting, like on the device
+            until = time.perf_counter() + delta_ms / 1000
+            while time.perf_counter() < until:
+                controller.step()
+                steps += 1
+        hal.midi_in_port.feed(data)
+        while hal.midi_in_port.incoming or controller.midi_input_pending():
+            controller.step()
+            steps += 1
+    controller.step()
+    steps += 1
+    while controller.display.dirty:
+        controller.step()
+        steps += 1
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a MIDI trace through the controller logic")
+    parser.add_argument("trace", help="trace file saved with \"trace save\"")
+    parser.add_argument("--device", default="keylab_essential_61", choices=sorted(PROFILES), help="emulated device")
+    parser.add_argument("--mode", default="arturia", choices=("arturia", "daw", "mcu"), help="controller mode")
+    parser.add_argument("--speed", default="max", choices=("max", "recorded"), help="replay speed")
+    parser.add_argument("--profile", action="store_true", help="run under cProfile")
+    parser.add_argument("--tracemalloc", action="store_true", help="trace memory allocations in the steady state")
+    parser.add_argument("--verbose", action="store_true", help="show what the controller prints")
+    args = parser.parse_args()
+
+    records = read_trace(args.trace)
+    incoming = [data for direction, _, data in records if direction == DIRECTION_IN]
+    recorded_out = b"".join(data for direction, _, data in records if direction == DIRECTION_OUT)
+
+    hal = HostHal()
+    console = io.StringIO()
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(console)
+    with output:
+        # At maximum speed, the display is written in every loop iteration instead of waiting for the next frame
+        max_fps = 0 if args.speed == "max" else 30
+        controller = Controller(hal, PROFILES[args.device], args.mode, instrumentation_on=True, display_max_fps=max_fps)
+        controller.start()
+
+    if args.tracemalloc:
+        # Replay once to warm up, so that only what the steady state allocates is traced
+        with output:
+            replay(hal, controller, records, False)
+        controller.stats.reset()
+        import tracemalloc
+        tracemalloc.start()
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    with output:
+        steps = replay(hal, controller, records, args.speed == "recorded")
+    elapsed = time.perf_counter() - start
+    if profiler is not None:
+        profiler.disable()
+    if args.tracemalloc:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    messages = controller.stats.counters[0]
+    in_bytes = sum(len(data) for data in incoming)
+    print("Replayed {} records: {} bytes in {} chunks, {} messages".format(len(records), in_bytes, len(incoming), messages))
+    print("{:.3f} s, {} loop iterations, {:.0f} messages/s, {:.0f} bytes/s".format(elapsed, steps, messages / elapsed, in_bytes / elapsed))
+    # The recorded output also has what the encoder and buttons sent, which is not replayed
+    print("MIDI out: {} bytes; recorded: {} bytes".format(len(hal.midi_out_port.sent), len(recorded_out)))
+    # On the device, the low-water mark shows whether the steady state allocates; mem_free() is None on the host
+    print("Idle garbage collections: {}, free heap low-water mark: {}".format(controller.gc_collections, controller.mem_free_low))
+    print("LCD:")
+    for line in hal.lcd.lines():
+        print("  |" + line + "|")
+    if args.tracemalloc:
+        print("Memory: {} bytes still allocated, {} bytes peak".format(current, peak))
+        for stat in snapshot.statistics("lineno")[:15]:
+            print(" ", stat)
+    if profiler is not None:
+        import pstats
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Settings that survive a power cycle, kept in microcontroller.nvm
+#
+# The mode and the emulated profile, if they were chosen on the serial console (instead of in code.py and
+# boot.py), and the I2C address the display was found at are kept in a small record at the start of nvm.
+# On the RP2040, nvm is a sector of the flash, and every write erases and rewrites it, so the record is only
+# written when a value actually changed, all at once, and only when save() is called (the controller does
+# that when the loop is idle, see Controller.collect_garbage()).
+#
+# Record layout:
+#   0      RECORD_MAGIC
+#   1      mode, index into MODES, or _UNSET
+#   2      display I2C address, or _UNSET
+#   3      length of the profile name, 0 for none
+#   4...   profile name, PROFILE_NAME_SIZE bytes
+#   last   checksum, the sum of the bytes before it modulo 256
+
+RECORD_MAGIC = 0x4D
+
+MODES = ("arturia", "daw", "mcu")
+
+PROFILE_NAME_SIZE = 32
+RECORD_SIZE = 4 + PROFILE_NAME_SIZE + 1
+
+_MODE = 1
+_DISPLAY_ADDRESS = 2
+_PROFILE_LENGTH = 3
+_PROFILE = 4
+_CHECKSUM = RECORD_SIZE - 1
+
+# Erased flash reads as FF
+_UNSET = 0xFF
+
+
+def _checksum(record):
+    total = 0
+    for i in range(_CHECKSUM):
+        total += record[i]
+    return total & 0xFF
+
+
+class Settings:
+    def __init__(self, nvm):
+        # nvm is microcontroller.nvm, or a bytearray on the host; None keeps the settings in RAM only
+        self.nvm = nvm
+        self.record = bytearray(RECORD_SIZE)
+        self.writes = 0
+        if nvm is not None and len(nvm) >= RECORD_SIZE:
+            self.record[:] = nvm[0:RECORD_SIZE]
+        if self.record[0] != RECORD_MAGIC or self.record[_CHECKSUM] != _checksum(self.record):
+            # Never written, or from something else
+            self.record[0] = RECORD_MAGIC
+            self.record[_MODE] = _UNSET
+            self.record[_DISPLAY_ADDRESS] = _UNSET
+            self.record[_PROFILE_LENGTH] = 0
+            self.record[_CHECKSUM] = _checksum(self.record)
+        # What nvm holds, as far as save() is concerned; defaults are not written until something changes
+        self.saved = bytes(self.record) if nvm is not None else None
+
+    @property
+    def mode(self):
+        # Mode that was used last, or None
+        mode = self.record[_MODE]
+        return MODES[mode] if mode < len(MODES) else None
+
+    @mode.setter
+    def mode(self, mode):
+        self.record[_MODE] = MODES.index(mode) if mode is not None else _UNSET
+
+    @property
+    def display_address(self):
+        # I2C address the display was found at last time, or None
+        address = self.record[_DISPLAY_ADDRESS]
+        return address if address != _UNSET else None
+
+    @display_address.setter
+    def display_address(self, address):
+        self.record[_DISPLAY_ADDRESS] = address if address is not None else _UNSET
+
+    @property
+    def profile(self):
+        # Name of the profile chosen on the serial console, or None for the one in boot.py
+        length = self.record[_PROFILE_LENGTH]
+        if length == 0 or length > PROFILE_NAME_SIZE:
+            return None
+        return bytes(self.record[_PROFILE:_PROFILE + length]).decode()
+
+    @profile.setter
+    def profile(self, name):
+        data = name.encode() if name is not None else b""
+        if len(data) > PROFILE_NAME_SIZE:
+            raise ValueError("Profile name too long: " + name)
+        self.record[_PROFILE_LENGTH] = len(data)
+        for i in range(PROFILE_NAME_SIZE):
+            self.record[_PROFILE + i] = data[i] if i < len(data) else 0
+
+    def save(self):
+        # Write the record if anything changed since it was read or last saved; returns whether it was written
+        if self.saved is None:
+            return False
+        record = self.record
+        saved = self.saved
+        record[_CHECKSUM] = _checksum(record)
+        for i in range(RECORD_SIZE):
+            if record[i] != saved[i]:
+                break
+        else:
+            return False
+        self.nvm[0:RECORD_SIZE] = record
+        self.saved = bytes(record)
+        self.writes += 1
+        return True
@@ -0,0 +1,124 @@
+# Runs the controller logic from controller.py on a Linux host, with the fakes from host_hal.py
+# instead of the Raspberry Pi Pico hardware, so that it can be profiled before flashing devices
+#
+# python3 simulate.py                  # Run a scripted AnalogLab session and show the results
+# python3 simulate.py --profile        # ... under cProfile
+# python3 simulate.py --tracemalloc    # ... and show where memory is allocated
+# python3 simulate.py --stats          # ... with instrumentation, see instrumentation.py
+
+import argparse
+import contextlib
+import io
+import time
+
+from controller import Controller
+from host_hal import HostHal, set_text_sysex
+from instrumentation import STATS_REQUEST
+from log import DEBUG, INFO
+from profiles import PROFILES
+
+INSTRUMENTS = ("ARP 2600", "Jupiter-8", "Mini V", "Prophet-5", "CS-80", "DX7")
+NAMES = ("Bloody Swing", "Brass Section", "Bright Pad", "Noise Sweep", "Soft Strings", "Bass Line")
+
+
+def run_session(hal, controller, presets):
+    # Scroll through presets with the encoder; the host answers every step with a set text sysex
+    steps = 0
+    for i in range(presets):
+        hal.encoder.turn(1)
+        controller.step()
+        # Along with the MIDI clock of the host, which the controller ignores
+        hal.midi_in_port.feed(b"\xF8\xF8\xF8")
+        hal.midi_in_port.feed(set_text_sysex(INSTRUMENTS[i // 10 % len(INSTRUMENTS)], NAMES[i % len(NAMES)], "Keys", heart=i % 3 == 0))
+        steps += 1
+        while hal.midi_in_port.incoming:
+            controller.step()
+            steps += 1
+        # Open the category menu now and then
+        if i % 50 == 49:
+            hal.keys.click(0)
+            controller.step()
+            hal.keys.click(1)
+            controller.step()
+            steps += 2
+    # Let the last frame reach the display, which is written at most display_max_fps times per second
+    controller.step()
+    steps += 1
+    while controller.display.dirty:
+        controller.step()
+        steps += 1
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the controller logic on a Linux host")
+    parser.add_argument("--device", default="keylab_essential_61", choices=sorted(PROFILES), help="emulated device")
+    parser.add_argument("--presets", type=int, default=500, help="number of preset changes to simulate")
+    parser.add_argument("--profile", action="store_true", help="run under cProfile")
+    parser.add_argument("--tracemalloc", action="store_true", help="trace memory allocations")
+    parser.add_argument("--stats", action="store_true", help="turn on instrumentation and show the statistics")
+    parser.add_argument("--trace", metavar="PATH", help="record the MIDI traffic and save it to PATH, for replay.py")
+    parser.add_argument("--verbose", action="store_true", help="show what the controller prints, including debug messages")
+    args = parser.parse_args()
+
+    hal = HostHal()
+    console = io.StringIO()
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(console)
+
+    with output:
+        controller = Controller(hal, PROFILES[args.device], instrumentation_on=args.stats, log_level=DEBUG if args.verbose else INFO,
+                                trace_on=args.trace is not None, trace_path=args.trace)
+        controller.start()
+
+    if args.tracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start = time.perf_counter()
+    with output:
+        steps = run_session(hal, controller, args.presets)
+    elapsed = time.perf_counter() - start
+
+    if profiler is not None:
+        profiler.disable()
+    if args.tracemalloc:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print("LCD:")
+    for line in hal.lcd.lines():
+        print("  |" + line + "|")
+    print("Loop iterations: {}, {:.1f} us each".format(steps, elapsed * 1e6 / steps))
+    print("MIDI out: {} bytes in {} writes".format(len(hal.midi_out_port.sent), hal.midi_out_port.writes))
+    print("LCD: {} commands, {} data writes".format(hal.lcd.commands, hal.lcd.data_writes))
+
+    if args.trace:
+        print("Saved", controller.trace.save(args.trace), "trace records to", args.trace)
+
+    if args.stats:
+        # As if STATS_REQUEST had been sent over MIDI
+        hal.midi_in_port.feed(STATS_REQUEST)
+        with output:
+            controller.step()
+            controller.step()
+        reply = hal.midi_out_port.sent[-len(controller.stats.reply):]
+        print("Statistics reply:", " ".join("{:02X}".format(b) for b in reply))
+        controller.stats.dump()
+
+    if profiler is not None:
+        import pstats
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    if args.tracemalloc:
+        print("Memory: {} bytes still allocated, {} bytes peak".format(current, peak))
+        for stat in snapshot.statistics("lineno")[:15]:
+            print(" ", stat)
+
+
+if __name__ == "__main__":
+    main()
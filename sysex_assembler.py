@@ -0,0 +1,135 @@
+# Streaming assembler for incoming sysex messages, with constant memory
+#
+# MidiFramer feeds the data bytes of a sysex message to SysexAssembler one at a time as they are read
+# from the port. The Arturia and MCU headers are recognized as soon as they have been received, and from
+# then on only what the handlers in controller.py need is kept:
+#
+# - Arturia set text: every field is cut to field_size characters, so that arbitrarily long preset names
+#   still result in a well-formed set text sysex that parse_set_text() handles as usual
+# - MCU (e.g. the LCD text, F0 00 00 66 14 12 pp tt... F7): everything that does not fit into the
+#   buffer is left out, which still contains the beginning of the text
+# - Anything else that does not fit into the buffer is dropped
+# - A sysex that is interrupted by a status byte other than F7 is lost, see abort()
+#
+# These are counted, in truncated and dropped (which includes the lost ones).
+
+from arturia_sysex import ARTURIA_HEADER, SET_TEXT, SET_TEXT_MINILAB3, KEYLAB_FIELDS_OFFSET, MINILAB3_FIELDS_OFFSET, FIELD_COUNT
+
+MCU_HEADER = b"\xF0\x00\x00\x66\x14"
+
+# What kind of sysex is being received
+KIND_OTHER = 0
+KIND_ARTURIA = 1
+KIND_MCU = 2
+
+# Assembler states
+_HEADER = 0    # Still matching the headers
+_BODY = 1      # Storing everything that fits
+_PREAMBLE = 2  # Storing the bytes before the first set text field
+_TAG = 3       # Set text, expecting a field tag
+_TEXT = 4      # Set text, inside a field
+
+
+class SysexAssembler:
+    def __init__(self, message, field_size=32):
+        self.message = message
+        # Always leave room for the F7 at the end
+        self.capacity = len(message) - 1
+        self.field_size = field_size
+        self.length = 0
+        self.kind = KIND_OTHER
+        self.state = _HEADER
+        # Bit 0: still matches ARTURIA_HEADER, bit 1: still matches MCU_HEADER
+        self.candidates = 0
+        self.fields_offset = 0
+        self.field_length = 0
+        self.overflow = False
+        self.clipped = False
+        # Messages that were cut short, and messages that were dropped because they did not fit or were interrupted
+        self.truncated = 0
+        self.dropped = 0
+
+    def start(self):
+        self.message[0] = 0xF0
+        self.length = 1
+        self.kind = KIND_OTHER
+        self.state = _HEADER
+        self.candidates = 3
+        self.overflow = False
+        self.clipped = False
+
+    def feed(self, b):
+        # Add one data byte
+        state = self.state
+        if state == _TEXT:
+            if b == 0x00:
+                self.state = _TAG
+            elif self.field_length < self.field_size:
+                self.field_length += 1
+            else:
+                self.clipped = True
+                return
+        elif state == _TAG:
+            if 0x01 <= b <= FIELD_COUNT:
+                self.state = _TEXT
+                self.field_length = 0
+
+        n = self.length
+        if n >= self.capacity:
+            if self.kind == KIND_MCU or state >= _PREAMBLE:
+                self.clipped = True
+            else:
+                self.overflow = True
+            return
+        self.message[n] = b
+        self.length = n + 1
+
+        if state == _HEADER:
+            self._match_header(n, b)
+        elif state == _PREAMBLE and n + 1 == self.fields_offset:
+            self.state = _TAG
+
+    def _match_header(self, n, b):
+        if n < len(ARTURIA_HEADER):
+            # Rule out the headers that do not match
+            candidates = self.candidates
+            if candidates & 1 and ARTURIA_HEADER[n] != b:
+                candidates &= ~1
+            if candidates & 2 and (n >= len(MCU_HEADER) or MCU_HEADER[n] != b):
+                candidates &= ~2
+            self.candidates = candidates
+            if candidates == 2 and n == len(MCU_HEADER) - 1:
+                self.kind = KIND_MCU
+                self.state = _BODY
+            elif candidates == 0:
+                self.state = _BODY
+            return
+        # After the Arturia header, check for 04 ?? 60 (set text)
+        self.kind = KIND_ARTURIA
+        if n == len(ARTURIA_HEADER):
+            if b != SET_TEXT:
+                self.state = _BODY
+        elif n == len(ARTURIA_HEADER) + 2:
+            if b != 0x60:
+                self.state = _BODY
+            elif self.message[n - 1] == SET_TEXT_MINILAB3:
+                self.fields_offset = MINILAB3_FIELDS_OFFSET
+                self.state = _PREAMBLE
+            else:
+                self.fields_offset = KEYLAB_FIELDS_OFFSET
+                self.state = _TAG
+
+    def abort(self):
+        # Another status byte came before the F7; what was received is lost, so it counts as dropped
+        self.dropped += 1
+
+    def end(self):
+        # The F7 has been received; returns the length of the message, or 0 if it was dropped
+        if self.overflow:
+            self.dropped += 1
+            return 0
+        if self.clipped:
+            self.truncated += 1
+        self.message[self.length] = 0xF7
+        self.length += 1
+        return self.length
@@ -0,0 +1,130 @@
+# The controller logic as cooperative asyncio tasks instead of one sequential loop
+#
+# Needs the asyncio library on the device (circup install asyncio); on a Linux host, CPython's asyncio works as well.
+#
+# - input:   encoder and buttons; what they send is queued in MidiOut
+# - midi in: handles pending MIDI input within the time budget; what it draws goes into the framebuffer
+# - midi out: sends whatever is queued in MidiOut with a single USB write
+# - display: writes the framebuffer to the LCD a few cells at a time, and only when no MIDI is waiting,
+#            unless the frame has been held back for a frame longer than display_max_fps allows
+# - console: commands typed on the serial console (see Controller.console_command()), printing the log, and
+#            collecting garbage when idle
+#
+# The tasks communicate through bounded buffers that already exist: MidiOut's preallocated buffer, which is
+# flushed early when full, and the framebuffer, which only ever holds the latest frame. Every task yields after
+# each pass, so a slow LCD write delays input and MIDI by at most DISPLAY_CELLS_PER_PASS cells. Tasks sleep
+# until they are next due rather than yielding with sleep(0), so that the CPU is idle when nothing happens;
+# only MIDI input that is left over from the time budget, or a frame that is being written in parts,
+# is picked up again right away.
+#
+# With instrumentation on (see instrumentation.py), each task times its own stage, the same stages as
+# Controller.step_instrumented(); "output" is the MIDI out and display tasks together.
+
+import asyncio
+
+from instrumentation import STAGE_OUTPUT, STAGE_ENCODER, STAGE_BUTTONS, STAGE_MIDI_IN
+
+# Number of LCD cells written before the display task yields to the others
+DISPLAY_CELLS_PER_PASS = 4
+
+# How often each task runs when there is nothing left over from its last pass, in seconds; the encoder is
+# counted by rotaryio and the buttons are queued by keypad in the background, so input can wait a few ms
+INPUT_INTERVAL = 0.005
+MIDI_IN_INTERVAL = 0.001
+MIDI_OUT_INTERVAL = 0.001
+DISPLAY_IDLE_INTERVAL = 0.005
+# How often the serial console is checked, in seconds
+CONSOLE_INTERVAL = 0.05
+
+
+async def input_task(controller):
+    # With instrumentation on, the time between two passes of this task goes into the loop histogram:
+    # it is INPUT_INTERVAL plus how long input waits while the other tasks run
+    monotonic_ns = controller.hal.monotonic_ns
+    stats = controller.stats
+    while True:
+        # The worst-case time between two passes of this task is the loop latency (see Controller.loop_time())
+        if stats is None:
+            controller.poll_encoder(controller.loop_time())
+            controller.poll_buttons()
+        else:
+            t = monotonic_ns()
+            if controller.last_loop_ns is not None:
+                stats.loop(t - controller.last_loop_ns)
+            controller.last_loop_ns = t
+            controller.poll_encoder(controller.loop_time())
+            now = monotonic_ns()
+            stats.stage(STAGE_ENCODER, now - t)
+            controller.poll_buttons()
+            stats.stage(STAGE_BUTTONS, monotonic_ns() - now)
+        await asyncio.sleep(INPUT_INTERVAL)
+
+
+async def midi_in_task(controller):
+    monotonic_ns = controller.hal.monotonic_ns
+    stats = controller.stats
+    while True:
+        if stats is None:
+            controller.poll_midi_in()
+        else:
+            t = monotonic_ns()
+            if controller.poll_midi_in():
+                stats.stage(STAGE_MIDI_IN, monotonic_ns() - t)
+            controller.count_sysex_losses()
+        # What did not fit into the time budget is handled after the other tasks had their turn
+        await asyncio.sleep(0 if controller.midi_input_pending() else MIDI_IN_INTERVAL)
+
+
+async def midi_out_task(controller):
+    monotonic_ns = controller.hal.monotonic_ns
+    stats = controller.stats
+    while True:
+        if stats is None:
+            controller.send_midi()
+        else:
+            t = monotonic_ns()
+            controller.send_midi()
+            stats.stage(STAGE_OUTPUT, monotonic_ns() - t)
+        await asyncio.sleep(MIDI_OUT_INTERVAL)
+
+
+async def display_task(controller):
+    ticks_ms = controller.hal.ticks_ms
+    monotonic_ns = controller.hal.monotonic_ns
+    stats = controller.stats
+    midi_out = controller.midi_out
+    scheduler = controller.display_scheduler
+    idle_ms = int(DISPLAY_IDLE_INTERVAL * 1000)
+    while True:
+        now = ticks_ms()
+        # MIDI has priority: leave the I2C bus alone while there is MIDI to send or bytes waiting to be framed,
+        # but not for so long that continuous traffic (e.g. MCU meters) keeps the display from ever changing
+        if (midi_out.length == 0 and not controller.midi_input_pending()) or controller.display_overdue(now):
+            if stats is None:
+                controller.update_display(now, DISPLAY_CELLS_PER_PASS)
+            else:
+                t = monotonic_ns()
+                if controller.update_display(now, DISPLAY_CELLS_PER_PASS):
+                    stats.stage(STAGE_OUTPUT, monotonic_ns() - t)
+            await asyncio.sleep(scheduler.wait_ms(ticks_ms(), idle_ms) / 1000)
+        else:
+            await asyncio.sleep(MIDI_IN_INTERVAL)
+
+
+async def console_task(controller):
+    ticks_ms = controller.hal.ticks_ms
+    while True:
+        controller.poll_console()
+        controller.collect_garbage(ticks_ms())
+        await asyncio.sleep(CONSOLE_INTERVAL)
+
+
+async def run_tasks(controller):
+    controller.start()
+    await asyncio.gather(
+        asyncio.create_task(input_task(controller)),
+        asyncio.create_task(midi_in_task(controller)),
+        asyncio.create_task(midi_out_task(controller)),
+        asyncio.create_task(display_task(controller)),
+        asyncio.create_task(console_task(controller)),
+    )
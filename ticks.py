@@ -0,0 +1,15 @@
+# Millisecond ticks that do not allocate
+#
+# On the device, time.monotonic_ns() returns a long integer and time.monotonic() a float, both of which are
+# allocated on the heap. supervisor.ticks_ms() returns a small integer that wraps around at 2**29 instead,
+# so differences between two ticks have to be taken with ticks_diff(), the same way as in adafruit_ticks.
+
+TICKS_PERIOD = 1 << 29
+_TICKS_MAX = TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+def ticks_diff(ticks1, ticks2):
+    # Signed difference ticks1 - ticks2 in ms, correct as long as it is less than about 3 days
+    diff = (ticks1 - ticks2) & _TICKS_MAX
+    return ((diff + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD